@@ -1,18 +1,59 @@
 #!/usr/bin/env python
 
 import os
+import sys
+import time
+import signal
+import socket
 import logging
-import collectd
+import argparse
+import threading
+import importlib
 
-from collectors.mon import Mon
-from collectors.rgw import RGW
-from collectors.osd import OSDs
-from collectors.iscsi import ISCSIGateway
-from collectors.common import flatten_dict, get_hostname
+from collectors.base import BaseCollector
+from collectors.common import KeyFlattener, get_hostname, monotonic
+
+try:
+    import collectd
+except ImportError:
+    # running as a standalone daemon (see main), so the plugin's messages go
+    # to the module log instead of collectd's
+    collectd = None
 
 
 PLUGIN_NAME = 'cephmetrics'
 
+plugin_log = collectd if collectd else logging.getLogger(PLUGIN_NAME)
+
+LOG_FILE = '/var/log/collectd-cephmetrics.log'
+
+# role -> DispatchTable
+DISPATCH_TABLES = {}
+
+
+class CollectorThread(threading.Thread):
+    """
+    Run a collector's get_stats method in the background, so a slow collector
+    doesn't hold up the other roles on the host
+    """
+
+    def __init__(self, collector):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.collector = collector
+        self.stats = None
+
+    def run(self):
+        try:
+            self.stats = self.collector.get_stats()
+        except Exception as e:
+            # an exception in a thread would otherwise be lost, so record it
+            # against the collector for the error_handler to pick up
+            self.collector.logger.exception("get_stats failed")
+            self.collector.error = True
+            self.collector.error_msgs.append("get_stats failed: "
+                                             "{}".format(e))
+
 
 class Ceph(object):
 
@@ -23,11 +64,47 @@ class Ceph(object):
         "iscsi": "ISCSIGateway"
     }
 
+    # role -> module providing the role's collector class. A module (and
+    # its dependencies e.g. rados, rbd) is only imported when the role's
+    # binary is found on the host
+    role_modules = {
+        "mon": "collectors.mon",
+        "rgw": "collectors.rgw",
+        "osd": "collectors.osd",
+        "iscsi": "collectors.iscsi"
+    }
+
+    # probe order
+    role_order = ("mon", "rgw", "osd", "iscsi")
+
+    # prefix used for role specific settings in the <Module> block
+    # e.g. MonTimeout
+    config_prefix = {
+        "mon": "Mon",
+        "rgw": "RGW",
+        "osd": "OSD",
+        "iscsi": "ISCSI"
+    }
+
+    default_timeout = 8
+
     def __init__(self):
         self.cluster_name = None
         self.event_url = None
         self.host_name = get_hostname()
 
+        self.concurrent = False
+        self.timeout = {}           # role -> deadline (secs) for get_stats
+        self.interval = {}          # role -> read interval (secs)
+        self.mon_query_mode = 'commands'
+        self.mon_cluster_stats = 'all'
+        self.rbd_scan_ttl = None
+        self.osd_counters = None
+        self.osd_histograms = None
+        self.osd_sample_rate = None
+        self._workers = {}          # role -> CollectorThread
+        self._last_stats = {}       # role -> last stats received
+
         self.mon = None
         self.rgw = None
         self.osd = None
@@ -38,105 +115,362 @@ class Ceph(object):
         set up which collector(s) to use
         """
 
-        if Mon.probe():
-            self.mon = Mon(self, self.cluster_name)
+        for role in Ceph.role_order:
+            class_name = Ceph.roles[role]
+            if not BaseCollector.role_present(class_name):
+                continue
+
+            module = importlib.import_module(Ceph.role_modules[role])
+            collector = getattr(module, class_name)
+            setattr(self, role, collector(self, self.cluster_name))
 
-        if RGW.probe():
-            self.rgw = RGW(self, self.cluster_name)
+    def get_timeout(self, role):
+        return self.timeout.get(role, Ceph.default_timeout)
 
-        if OSDs.probe():
-            self.osd = OSDs(self, self.cluster_name)
+    def _get_stats_concurrent(self, roles):
+        """
+        Run each collector in it's own thread, and wait for each one up to
+        it's deadline. A collector that overruns is left running and it's
+        previous stats (if any) are returned in place of the current ones
+        :param roles: (list) roles to collect
+        :return: (dict) stats indexed by role
+        """
 
-        if ISCSIGateway.probe():
-            self.iscsi = ISCSIGateway(self, self.cluster_name)
+        start = time.time()
+        stats = {}
+        workers = {}
+
+        for role in roles:
+            collector = getattr(self, role)
+            if not collector:
+                continue
+
+            worker = self._workers.get(role)
+            if worker and worker.is_alive():
+                # the call from a prior cycle is still running, so we just
+                # wait on that instead of stacking up another call
+                pass
+            else:
+                if worker and worker.stats is not None:
+                    # finished after it's deadline, so the stats are late
+                    # but still the most recent we have
+                    self._last_stats[role] = worker.stats
+
+                worker = CollectorThread(collector)
+                worker.start()
+                self._workers[role] = worker
+
+            workers[role] = worker
+
+        for role in workers:
+            worker = workers[role]
+            deadline = start + self.get_timeout(role)
+            worker.join(max(deadline - time.time(), 0))
+
+            if worker.is_alive():
+                collector = getattr(self, role)
+                collector.error = True
+
+                if role in self._last_stats:
+                    stats[role] = self._last_stats[role]
+                    outcome = "last known stats used"
+                else:
+                    outcome = "no stats to report"
+
+                collector.error_msgs.append(
+                    "get_stats exceeded the {}s deadline - {}".format(
+                        self.get_timeout(role), outcome))
+
+            else:
+                del self._workers[role]
+                if worker.stats is not None:
+                    self._last_stats[role] = worker.stats
+                    stats[role] = worker.stats
 
-    def get_stats(self):
+        return stats
+
+    def get_stats(self, roles=None):
+        """
+        gather the stats from the active collectors
+        :param roles: (list) roles to collect, defaults to all roles
+        :return: (dict) stats indexed by role
+        """
+
+        if roles is None:
+            roles = list(Ceph.roles)
+
+        if self.concurrent:
+            return self._get_stats_concurrent(roles)
 
         stats = {}
 
-        if self.mon:
+        if self.mon and 'mon' in roles:
             stats['mon'] = self.mon.get_stats()
 
-        if self.rgw:
+        if self.rgw and 'rgw' in roles:
             stats['rgw'] = self.rgw.get_stats()
 
-        if self.osd:
+        if self.osd and 'osd' in roles:
             stats['osd'] = self.osd.get_stats()
 
-        if self.iscsi:
+        if self.iscsi and 'iscsi' in roles:
             stats['iscsi'] = self.iscsi.get_stats()
 
         return stats
 
 
-def write_stats(role_metrics, stats):
+class DispatchTable(object):
+    """
+    Holds a prepared collectd.Values object for each flattened metric key of
+    a role, so a read cycle only needs to fill in the values and dispatch
+    them. Entries are only compiled when a new key is seen, and the table is
+    rebuilt when keys drop out of the stats. The stats are flattened as
+    they're dispatched
+    """
 
-    flat_stats = flatten_dict(stats, '.')
-    
-    for key_name in flat_stats:
-        attr_name = key_name.split('.')[-1]
+    def __init__(self, cluster_name):
+        self.cluster_name = cluster_name
+        self.role_metrics = None
+        self.flattener = KeyFlattener('.')
+        self._table = {}        # key_name -> [Values, cycle last seen]
+        self._cycle = 0
+
+    def _compile(self, key_name):
+
+        attr_name = key_name.rsplit('.', 1)[-1]
 
         # TODO: this needs some more think time, since the key from the name
         # is not the key of the all_metrics dict
-        if attr_name in role_metrics:
-            attr_type = role_metrics[attr_name][1]     # gauge / derive etc
+        if attr_name in self.role_metrics:
+            attr_type = self.role_metrics[attr_name][1]  # gauge / derive etc
         else:
             # assign a default
             attr_type = 'gauge'
 
-        attr_value = flat_stats[key_name]
-
         val = collectd.Values(plugin=PLUGIN_NAME, type=attr_type)
-        instance_name = "{}.{}".format(CEPH.cluster_name,
-                                       key_name)
-        val.type_instance = instance_name
-        val.values = [attr_value]
-        val.dispatch()
+        val.type_instance = "{}.{}".format(self.cluster_name,
+                                           key_name)
+        return val
+
+    def dispatch(self, role_metrics, stats):
+
+        if role_metrics is not self.role_metrics:
+            # metric types may have changed, so start over
+            self.role_metrics = role_metrics
+            self._table = {}
+
+        table = self._table
+        self._cycle += 1
+        cycle = self._cycle
+        dispatched = 0
+
+        for key_name, attr_value in self.flattener.items(stats):
+            entry = table.get(key_name)
+            if entry is None:
+                entry = [self._compile(key_name), cycle]
+                table[key_name] = entry
+            else:
+                entry[1] = cycle
+
+            val = entry[0]
+            val.values = [attr_value]
+            val.dispatch()
+            dispatched += 1
+
+        if len(table) != dispatched:
+            # some metrics are no longer reported, so drop their entries
+            self._table = {key_name: entry
+                           for key_name, entry in table.items()
+                           if entry[1] == cycle}
+
+
+def write_stats(role, role_metrics, stats):
+
+    if role not in DISPATCH_TABLES:
+        DISPATCH_TABLES[role] = DispatchTable(CEPH.cluster_name)
+
+    DISPATCH_TABLES[role].dispatch(role_metrics, stats)
 
 
 def configure_callback(conf):
 
+    if configure(conf):
+        register_read_callbacks()
+
+
+def get_number(module_parms, setting):
+    """
+    :param module_parms: (dict) setting -> first value of the config node
+    :param setting: (str) name of a numeric setting
+    :return: (float) the setting's value, or None if it's not given or isn't
+             a number (which is logged)
+    """
+
+    if setting not in module_parms:
+        return None
+
+    try:
+        return float(module_parms[setting])
+    except (TypeError, ValueError):
+        plugin_log.error("cephmetrics: {} specified is invalid - must be "
+                         "a number".format(setting))
+        return None
+
+
+def configure(conf):
+    """
+    Apply the <Module cephmetrics> settings to CEPH, and probe for the roles
+    :param conf: (collectd.Config) config node, with a child per setting
+    :return: (bool) whether the plugin is ready to collect
+    """
+
     valid_log_levels = ['debug', 'info']
 
     global CEPH
     module_parms = {node.key: node.values[0] for node in conf.children}
 
+    # logging comes first, so the standalone daemon has somewhere to put
+    # the setting errors
     log_level = module_parms.get('LogLevel', 'debug')
+    setup_module_logging(log_level)
+
     if log_level not in valid_log_levels:
-        collectd.error("cephmetrics: LogLevel specified is invalid - must"
-                       " be :{}".format(' or '.join(valid_log_levels)))
+        plugin_log.error("cephmetrics: LogLevel specified is invalid - must"
+                         " be :{}".format(' or '.join(valid_log_levels)))
 
     if 'EventURL' in module_parms:
         CEPH.event_url = module_parms['EventURL']
-        collectd.info("cephmetrics: Event messages enabled for target "
-                      "{}".format(CEPH.event_url))
+        plugin_log.info("cephmetrics: Event messages enabled for target "
+                        "{}".format(CEPH.event_url))
+    else:
+        plugin_log.warning("cephmetrics: EventURL missing - health events "
+                           "will not be reported")
+
+    if module_parms.get('Concurrent', False) in (True, 'true', 'True'):
+        CEPH.concurrent = True
+
+    mon_query_mode = module_parms.get('MonQueryMode', 'commands')
+    if mon_query_mode in ('commands', 'status'):
+        CEPH.mon_query_mode = mon_query_mode
+    else:
+        plugin_log.error("cephmetrics: MonQueryMode specified is invalid - "
+                         "must be : commands or status")
+
+    mon_cluster_stats = module_parms.get('MonClusterStats', 'all')
+    if mon_cluster_stats in ('all', 'leader'):
+        CEPH.mon_cluster_stats = mon_cluster_stats
     else:
-        collectd.warning("cephmetrics: EventURL missing - health events "
-                         "will not be reported")
+        plugin_log.error("cephmetrics: MonClusterStats specified is invalid - "
+                         "must be : all or leader")
+
+    # OSDCounters takes a list of values
+    osd_counters = [pattern for node in conf.children
+                    if node.key == 'OSDCounters'
+                    for pattern in node.values]
+    if osd_counters:
+        CEPH.osd_counters = osd_counters
+
+    osd_histograms = [pattern for node in conf.children
+                      if node.key == 'OSDHistograms'
+                      for pattern in node.values]
+    if osd_histograms:
+        CEPH.osd_histograms = osd_histograms
+
+    osd_sample_rate = get_number(module_parms, 'OSDSampleRate')
+    if osd_sample_rate is not None:
+        if 0.1 <= osd_sample_rate <= 1:
+            CEPH.osd_sample_rate = osd_sample_rate
+        else:
+            plugin_log.error("cephmetrics: OSDSampleRate specified is invalid "
+                             "- must be between 0.1 and 1 (secs)")
+
+    rbd_scan_ttl = get_number(module_parms, 'RBDScanTTL')
+    if rbd_scan_ttl is not None:
+        CEPH.rbd_scan_ttl = rbd_scan_ttl
+
+    collector_timeout = get_number(module_parms, 'CollectorTimeout')
+    for role in Ceph.roles:
+        setting = '{}Timeout'.format(Ceph.config_prefix[role])
+        timeout = get_number(module_parms, setting)
+        if timeout is None:
+            timeout = collector_timeout
+        if timeout is not None:
+            CEPH.timeout[role] = timeout
+
+        interval = get_number(module_parms,
+                              '{}Interval'.format(Ceph.config_prefix[role]))
+        if interval is not None:
+            CEPH.interval[role] = interval
+
+    if CEPH.concurrent:
+        deadlines = ['{}:{}s'.format(role, CEPH.get_timeout(role))
+                     for role in sorted(Ceph.roles)]
+        plugin_log.info("cephmetrics: collectors will run concurrently - "
+                        "deadlines {}".format(','.join(deadlines)))
 
     if 'ClusterName' in module_parms:
         cluster_name = module_parms['ClusterName']
         # cluster name is all we need to get started
         if not os.path.exists('/etc/ceph/{}.conf'.format(cluster_name)):
-            collectd.error("Clustername given ('{}') not found in "
-                           "/etc/ceph".format(module_parms['ClusterName']))
+            plugin_log.error("Clustername given ('{}') not found in "
+                             "/etc/ceph".format(module_parms['ClusterName']))
 
         # let's assume the conf file is OK to use
         CEPH.cluster_name = cluster_name
 
-        setup_module_logging(log_level)
-
         CEPH.probe()
 
-        collectd.info("{}: Roles detected - "
-                      "mon:{} osd:{} rgw:{} "
-                      "iscsi:{}".format(__name__,
-                                        isinstance(CEPH.mon, Mon),
-                                        isinstance(CEPH.osd, OSDs),
-                                        isinstance(CEPH.rgw, RGW),
-                                        isinstance(CEPH.iscsi, ISCSIGateway)))
+        plugin_log.info("{}: Roles detected - "
+                        "mon:{} osd:{} rgw:{} "
+                        "iscsi:{}".format(PLUGIN_NAME,
+                                          CEPH.mon is not None,
+                                          CEPH.osd is not None,
+                                          CEPH.rgw is not None,
+                                          CEPH.iscsi is not None))
+
+        return True
     else:
-        collectd.error("cephmetrics: ClusterName is required")
+        plugin_log.error("cephmetrics: ClusterName is required")
+        return False
+
+
+def read_schedule():
+    """
+    Roles with their own interval get a read callback of their own, all
+    other roles share a single callback that runs at the global Interval
+    :return: (list) of (name, interval or None for the global Interval,
+             roles) for each read callback
+    """
+
+    schedule = []
+    shared_roles = []
+
+    for role in sorted(Ceph.roles):
+        if not getattr(CEPH, role):
+            continue
+
+        if role in CEPH.interval:
+            schedule.append(('{}.{}'.format(PLUGIN_NAME, role),
+                             CEPH.interval[role], [role]))
+            plugin_log.info("cephmetrics: {} stats collected every "
+                            "{}s".format(role, CEPH.interval[role]))
+        else:
+            shared_roles.append(role)
+
+    if shared_roles:
+        schedule.append((PLUGIN_NAME, None, shared_roles))
+
+    return schedule
+
+
+def register_read_callbacks():
+
+    for name, interval, roles in read_schedule():
+        if interval is None:
+            collectd.register_read(read_callback, data=roles, name=name)
+        else:
+            collectd.register_read(read_callback, interval=interval,
+                                   data=roles, name=name)
 
 
 def setup_module_logging(log_level):
@@ -145,7 +479,7 @@ def setup_module_logging(log_level):
              "info": logging.INFO}
 
     logging.getLogger('cephmetrics')
-    logging.basicConfig(filename='/var/log/collectd-cephmetrics.log',
+    logging.basicConfig(filename=LOG_FILE,
                         format='%(asctime)s - %(levelname)-7s - '
                                '[%(filename)s:%(lineno)s:%(funcName)s() - '
                                '%(message)s',
@@ -153,17 +487,24 @@ def setup_module_logging(log_level):
                         level=level.get(log_level))
 
 
-def read_callback():
+def read_callback(roles=None, write=write_stats):
+
+    if roles is None:
+        roles = list(Ceph.roles)
 
-    stats = CEPH.get_stats()
+    stats = CEPH.get_stats(roles)
 
     for role in Ceph.roles:
-        if role in stats:
-            collector = getattr(CEPH, role)
+        collector = getattr(CEPH, role)
+        if not collector or role not in roles:
+            continue
 
-            write_stats(collector.all_metrics, stats[role])
+        if role in stats:
+            write(role, collector.all_metrics, stats[role])
 
-            error_handler(collector)
+        # a collector that failed or overran has no stats, but it's errors
+        # still need reporting
+        error_handler(collector)
 
 
 def error_handler(collector):
@@ -173,23 +514,150 @@ def error_handler(collector):
     # detected an error, let's flag it to the collectd log
     msg_text = ",".join(collector.error_msgs)
 
-    collectd.error("cephmetrics error: {} - {}".format(collector._name,
-                                                       msg_text))
+    plugin_log.error("cephmetrics error: {} - {}".format(collector._name,
+                                                         msg_text))
 
     # reset the collector instance's error tracking
     collector.error = False
     del collector.error_msgs[:]
 
 
-if __name__ == '__main__':
+class ConfigNode(object):
+    """
+    A setting given on the command line, in the shape of a collectd config
+    node so the standalone daemon shares configure with the plugin
+    """
+
+    def __init__(self, key, values):
+        self.key = key
+        self.values = values
+        self.children = []
+
+
+def parse_args(argv=None):
+
+    parser = argparse.ArgumentParser(
+        description="Run the cephmetrics collectors outside of collectd")
+    parser.add_argument('--cluster', default='ceph',
+                        help="cluster name (default: %(default)s)")
+    parser.add_argument('--interval', type=float, default=10,
+                        help="global read interval in secs "
+                             "(default: %(default)s)")
+    parser.add_argument('--sink', action='append', dest='sinks',
+                        metavar='SPEC',
+                        help="where to send the metrics, may be repeated. "
+                             "graphite:HOST[:PORT], pickle:HOST[:PORT], "
+                             "json[:PATH] or prometheus:PATH "
+                             "(default: json)")
+    parser.add_argument('-o', '--option', action='append', default=[],
+                        dest='options', metavar='KEY=VALUE',
+                        help="any setting of the collectd <Module "
+                             "cephmetrics> block e.g. -o OSDInterval=5, "
+                             "repeat a key for multi-valued settings")
+    parser.add_argument('--log-file', default=None,
+                        help="log file (default: stderr)")
+    parser.add_argument('--once', action='store_true',
+                        help="run every read once, then exit")
+
+    args = parser.parse_args(argv)
+
+    # settings collectd would pass as numbers
+    numeric = {'OSDSampleRate', 'RBDScanTTL', 'CollectorTimeout'}
+    for role in Ceph.roles:
+        numeric.add('{}Timeout'.format(Ceph.config_prefix[role]))
+        numeric.add('{}Interval'.format(Ceph.config_prefix[role]))
+
+    conf = ConfigNode('Module', [PLUGIN_NAME])
+    settings = {'ClusterName': [args.cluster]}
+    for option in args.options:
+        key, sep, value = option.partition('=')
+        if not sep:
+            parser.error("option '{}' is not KEY=VALUE".format(option))
+        if key in numeric:
+            try:
+                float(value)
+            except ValueError:
+                parser.error("option '{}' needs a number".format(key))
+        settings.setdefault(key, []).append(value)
+    conf.children = [ConfigNode(setting, settings[setting])
+                     for setting in sorted(settings)]
+
+    return args, conf
+
+
+def run(schedule, interval, writer, once=False):
+    """
+    Standalone scheduler - runs each read of the schedule at it's interval,
+    on the monotonic clock. A read that overruns it's interval skips the
+    missed cycles rather than running back to back
+    """
+
+    due = {name: monotonic() for name, _interval, _roles in schedule}
+
+    while True:
+        for name, read_interval, roles in schedule:
+            now = monotonic()
+            if now < due[name]:
+                continue
+
+            read_callback(roles, write=writer.write)
+            writer.flush()
+
+            read_interval = read_interval or interval
+            due[name] += read_interval
+            if due[name] <= monotonic():
+                due[name] = monotonic() + read_interval
+
+        if once:
+            return
+
+        time.sleep(max(min(due.values()) - monotonic(), 0))
+
 
-    # run interactively or maybe test the code
+def main(argv=None):
 
-    pass
+    global LOG_FILE
+
+    # sinks are only needed standalone
+    from collectors.sinks import SinkWriter, create_sink
+
+    args, conf = parse_args(argv)
+    LOG_FILE = args.log_file
+
+    sinks = []
+    for spec in args.sinks or ['json']:
+        try:
+            sinks.append(create_sink(spec, args.cluster, socket.getfqdn()))
+        except ValueError as e:
+            sys.exit("cephmetrics: {}".format(e))
+
+    if not configure(conf):
+        sys.exit(1)
+
+    schedule = read_schedule()
+    if not schedule:
+        sys.exit("cephmetrics: no ceph roles found on this host")
+
+    # exit cleanly on SIGTERM, so the sinks are flushed and closed
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+
+    writer = SinkWriter(sinks)
+    try:
+        run(schedule, args.interval, writer, once=args.once)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        writer.close()
+
+
+CEPH = Ceph()
+
+if __name__ == '__main__':
 
-else:
+    main()
 
-    CEPH = Ceph()
+elif collectd:
 
+    # read callbacks are registered once the roles are known, in
+    # configure_callback
     collectd.register_config(configure_callback)
-    collectd.register_read(read_callback)
@@ -0,0 +1,123 @@
+#!/usr/bin/env python
+
+import json
+import errno
+import socket
+import struct
+import threading
+
+
+class AdminSocket(object):
+    """
+    Client for a ceph daemon's admin socket, that speaks the asok protocol
+    directly. A request is the json encoded command terminated by a null,
+    and the reply is a 4 byte (big endian) length followed by the payload.
+
+    Ceph daemons close the connection once a reply is sent, so the
+    connection is only reused when the peer has left it open. Replies are
+    read into a buffer held by the client, that grows to fit the largest
+    reply seen.
+    """
+
+    header = struct.Struct('>I')
+
+    def __init__(self, path, timeout=5, buffer_size=4096):
+        self.path = path
+        self.timeout = timeout
+        self._sock = None
+        self._buffer = bytearray(buffer_size)
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        try:
+            sock.connect(self.path)
+        except socket.error:
+            sock.close()
+            raise
+        return sock
+
+    def _reusable(self):
+        """
+        check whether the current connection is still open, without blocking
+        :return: (bool) True if the connection can be used for a request
+        """
+
+        if self._sock is None:
+            return False
+
+        self._sock.setblocking(False)
+        try:
+            self._sock.recv(1, socket.MSG_PEEK)
+        except socket.error as e:
+            # nothing to read, so the connection is still open
+            return e.errno in (errno.EAGAIN, errno.EWOULDBLOCK)
+        else:
+            # either closed by the peer, or holding data we didn't ask for
+            return False
+        finally:
+            self._sock.settimeout(self.timeout)
+
+    def _recv(self, sock, length):
+        """
+        read an exact number of bytes into the client's buffer
+        :param sock: (socket) connected socket
+        :param length: (int) number of bytes to read
+        :return: (memoryview) view of the data read
+        """
+
+        if len(self._buffer) < length:
+            self._buffer = bytearray(length)
+
+        view = memoryview(self._buffer)
+        got = 0
+        while got < length:
+            received = sock.recv_into(view[got:length], length - got)
+            if received == 0:
+                raise RuntimeError("connection closed after {} of {} "
+                                   "bytes".format(got, length))
+            got += received
+
+        return view[:length]
+
+    def close(self):
+        if self._sock is not None:
+            self._sock.close()
+            self._sock = None
+
+    def command(self, prefix, **kwargs):
+        """
+        Issue a command to the daemon
+        :param prefix: (str) command e.g. 'perf dump'
+        :param kwargs: command arguments e.g. logger='osd'
+        :return: (str) the daemon's response
+        """
+
+        request = dict(kwargs)
+        request['prefix'] = prefix
+        request.setdefault('format', 'json')
+        payload = json.dumps(request).encode('utf-8') + b'\0'
+
+        with self._lock:
+            for attempt in (1, 2):
+                reused = self._reusable()
+                try:
+                    if not reused:
+                        self.close()
+                        self._sock = self._connect()
+
+                    self._sock.sendall(payload)
+                    length = AdminSocket.header.unpack(
+                        self._recv(self._sock, 4).tobytes())[0]
+                    response = self._recv(self._sock, length).tobytes()
+
+                except (socket.error, RuntimeError) as e:
+                    self.close()
+                    if reused and attempt == 1:
+                        # the daemon dropped the idle connection, so try
+                        # again with a new one
+                        continue
+                    raise RuntimeError("{} : {}".format(self.path, e))
+
+                return response
@@ -1,12 +1,13 @@
 #!/usr/bin/env python
 
+import re
 import json
 import time
 import logging
 import os
 
-from ceph_daemon import admin_socket
-from collectors.common import os_cmd, cmd_exists
+from collectors.asok import AdminSocket
+from collectors.common import os_cmd, cmd_exists, which
 
 
 class BaseCollector(object):
@@ -18,21 +19,46 @@ class BaseCollector(object):
         "ISCSIGateway": "gwcli"
     }
 
+    # secs to wait on an admin socket connect, send or receive
+    asok_timeout = 5
+
+    # (binary path, (inode, mtime)) -> version, shared by all collectors so
+    # a binary is only run once per install
+    binary_versions = {}
+
     def __init__(self, parent, cluster_name, admin_socket=None):
         self._name = self.__class__.__name__
         self._parent = parent
         self.cluster_name = cluster_name
         self.admin_socket = admin_socket
-        self.version = self.get_version()
         self.error = False
         self.error_msgs = []
+        self._asok_clients = {}     # socket path -> AdminSocket
+        self._version = 0
+        self._version_key = None
 
         self.logger = logging.getLogger('cephmetrics')
 
         self.logger.info("ceph version for {}: {}".format(self._name,
                                                           self.version))
 
-    def _admin_socket(self, cmds=None, socket_path=None):
+    def _asok_client(self, socket_path):
+        client = self._asok_clients.get(socket_path)
+        if client is None:
+            client = AdminSocket(socket_path,
+                                 timeout=BaseCollector.asok_timeout)
+            self._asok_clients[socket_path] = client
+        return client
+
+    def _admin_socket(self, cmds=None, socket_path=None, **cmd_args):
+        """
+        Issue a command to a daemon's admin socket
+        :param cmds: (list) command words, defaults to perf dump
+        :param socket_path: (str) admin socket to use instead of the
+                            collector's own
+        :param cmd_args: command arguments e.g. logger='osd'
+        :return: (dict) decoded response, empty if the command failed
+        """
 
         adm_socket = self.admin_socket if not socket_path else socket_path
 
@@ -43,43 +69,111 @@ class BaseCollector(object):
 
         if os.path.exists(adm_socket):
             try:
-                response = admin_socket(adm_socket, cmds,
-                                        format='json')
-            except RuntimeError as e:
-                self.logger.error("admin_socket error: {}".format(e.message))
+                resp = json.loads(self._asok_client(adm_socket).command(
+                    ' '.join(cmds), **cmd_args))
+            except (RuntimeError, ValueError) as e:
+                self.logger.error("admin_socket error: {}".format(e))
                 self.error = True
-                self.error_msgs = [e.message]
+                self.error_msgs = [str(e)]
                 resp = {}
-            else:
-                resp = json.loads(response)
         else:
             resp = {}
 
         end = time.time()
 
-        self.logger.debug("admin_socket call '{}' : "
+        self.logger.debug("admin_socket call '{}' {}: "
                           "{:.3f}s".format(' '.join(cmds),
+                                           cmd_args if cmd_args else '',
                                            (end - start)))
 
         return resp
 
-    def get_version(self):
+    @staticmethod
+    def parse_version(vers_output):
         """
         Although the version number is v.r.m based, this isn't a float so it
         can't be stored as a number, so the version returned is just the
         vesion.release components (i.e. looks like a float!)
-        :return: (float) version number (v.r format)
+        :param vers_output: (str) version text e.g. 12.2.5 or the output of
+                            a -v option
+        :return: (float) version number (v.r format), 0 if not found
         """
         # version command returns output like this
         # ceph version 10.2.2-15.el7cp (60cd52496ca02bdde9c2f4191e617f75166d87b6)
 
-        cmd = BaseCollector.class_to_cmd.get(self._name, 'ceph')
-        vers_output = os_cmd('{} -v'.format(cmd))
-        if vers_output:
-            return float('.'.join(vers_output.split()[2].split('.')[:2]))
+        match = re.search(r'(\d+)\.(\d+)', vers_output or '')
+        if match:
+            return float('.'.join(match.groups()))
         else:
             return 0
 
+    @staticmethod
+    def _stat_key(path):
+        if not path:
+            return None
+        try:
+            path_stat = os.stat(path)
+        except OSError:
+            return None
+        return path_stat.st_ino, path_stat.st_mtime
+
+    @property
+    def version(self):
+        """
+        The version is re-read only when the daemon's admin socket or the
+        role's binary changes (restart or package upgrade), which is checked
+        with a stat of each
+        :return: (float) version number (v.r format)
+        """
+
+        binary = which(BaseCollector.class_to_cmd.get(self._name, 'ceph'))
+        version_key = (binary, BaseCollector._stat_key(binary),
+                       self.admin_socket,
+                       BaseCollector._stat_key(self.admin_socket))
+
+        if version_key != self._version_key:
+            version = self.get_version(binary, version_key[1])
+            if self._version_key is not None and version != self._version:
+                self.logger.info("ceph version for {} changed from {} to "
+                                 "{}".format(self._name, self._version,
+                                             version))
+            self._version = version
+            self._version_key = version_key
+
+        return self._version
+
+    def get_version(self, binary=None, binary_id=None):
+        """
+        Determine the version from the running daemon's admin socket, or
+        failing that from the role's binary
+        :param binary: (str) path to the role's binary
+        :param binary_id: (tuple) inode and mtime of the binary
+        :return: (float) version number (v.r format)
+        """
+
+        if self.admin_socket and os.path.exists(self.admin_socket):
+            try:
+                response = json.loads(
+                    self._asok_client(self.admin_socket).command('version'))
+            except (RuntimeError, ValueError) as e:
+                self.logger.warning("unable to get the version from "
+                                    "{} : {}".format(self.admin_socket, e))
+            else:
+                version = BaseCollector.parse_version(
+                    response.get('version'))
+                if version:
+                    return version
+
+        if not binary:
+            return 0
+
+        cache_key = (binary, binary_id)
+        if cache_key not in BaseCollector.binary_versions:
+            BaseCollector.binary_versions[cache_key] = \
+                BaseCollector.parse_version(os_cmd('{} -v'.format(binary)))
+
+        return BaseCollector.binary_versions[cache_key]
+
     @classmethod
     def probe(cls):
         """
@@ -87,7 +181,18 @@ class BaseCollector(object):
         :return: (bool) showing whether the binary was found or not
         """
 
-        return cmd_exists(BaseCollector.class_to_cmd.get(cls.__name__))
+        return BaseCollector.role_present(cls.__name__)
+
+    @staticmethod
+    def role_present(class_name):
+        """
+        Look for the binary of a collector class by name, so a role can be
+        probed without importing the collector's module
+        :param class_name: (str) collector class name e.g. OSDs
+        :return: (bool) showing whether the binary was found or not
+        """
+
+        return cmd_exists(BaseCollector.class_to_cmd.get(class_name))
 
     def get_stats(self):
 
@@ -3,14 +3,104 @@
 
 import socket
 import os
+import io
+import time
+import math
+import logging
+import threading
+import ctypes
+import operator
 import subprocess
+import Queue
+from array import array
+
+# numpy is optional, and only imported once a DiskStats engine is created so
+# hosts that don't track any disks don't pay for the import
+numpy = None
+_numpy_checked = False
+
+
+def load_numpy():
+    """
+    Import numpy on first use
+    :return: (module) numpy, or None when it's not installed
+    """
+
+    global numpy, _numpy_checked
+
+    if not _numpy_checked:
+        _numpy_checked = True
+        try:
+            import numpy
+        except ImportError:
+            numpy = None
+
+    return numpy
+
+
+class _timespec(ctypes.Structure):
+    _fields_ = [('tv_sec', ctypes.c_long), ('tv_nsec', ctypes.c_long)]
+
+
+def _load_clock_gettime():
+    # clock_gettime lives in librt on older glibc releases
+    for lib_name in ('libc.so.6', 'librt.so.1'):
+        try:
+            clock_gettime = ctypes.CDLL(lib_name, use_errno=True).clock_gettime
+        except (OSError, AttributeError):
+            continue
+        clock_gettime.argtypes = [ctypes.c_int, ctypes.POINTER(_timespec)]
+        return clock_gettime
+    return None
+
+
+_clock_gettime = _load_clock_gettime()
+CLOCK_MONOTONIC = 1
+
+
+def monotonic():
+    """
+    Seconds from an arbitrary point, that aren't affected by changes to the
+    system clock. Used to time the intervals that rates are calculated over
+    :return: (float) monotonic time
+    """
+
+    if _clock_gettime is None:
+        return time.time()
+
+    ts = _timespec()
+    if _clock_gettime(CLOCK_MONOTONIC, ctypes.byref(ts)) != 0:
+        errno_ = ctypes.get_errno()
+        raise OSError(errno_, os.strerror(errno_))
+    return ts.tv_sec + ts.tv_nsec * 1e-9
+
+
+_which_cache = {}      # (command, $PATH) -> full path of the command
+
+
+def which(command):
+    """
+    Find a command on $PATH. Lookups are cached against the value of $PATH,
+    since it's walked on every call otherwise
+    :param command: (str) command name
+    :return: (str) full path to the command, or None if it's not found
+    """
+
+    search_path = os.environ.get("PATH", "")
+    key = (command, search_path)
+    if key not in _which_cache:
+        _which_cache[key] = None
+        for path in search_path.split(os.pathsep):
+            cmd_path = os.path.join(path, command)
+            if os.access(cmd_path, os.X_OK):
+                _which_cache[key] = cmd_path
+                break
+
+    return _which_cache[key]
 
 
 def cmd_exists(command):
-    return any(
-        os.access(os.path.join(path, command), os.X_OK)
-        for path in os.environ["PATH"].split(os.pathsep)
-    )
+    return which(command) is not None
 
 
 def os_cmd(command):
@@ -21,7 +111,9 @@ def os_cmd(command):
     :return: (str) command response (lines terminated with \n)
     """
     cmd_list = command.split(' ')
-    if cmd_exists(cmd_list[0]):
+    cmd_path = which(cmd_list[0])
+    if cmd_path:
+        cmd_list[0] = cmd_path
         cmd_output = subprocess.check_output(cmd_list,
                                              stderr=subprocess.STDOUT).rstrip()
         return cmd_output
@@ -77,24 +169,137 @@ def flatten_dict(data, separator='.', prefix=''):
             } if isinstance(data, dict) else {prefix: data}
 
 
-def todict(obj):
+class KeyFlattener(object):
     """
-    convert an object to a dict representation
-    :param obj: (object) object to examine, to extract variables/values from
-    :return: (dict) representation of the given object
+    Flattens a nested dict into (key, value) pairs from a generator, without
+    building intermediate dicts. The stats tree has the same shape from one
+    interval to the next, so each joined key is cached against it's prefix
+    and key - the same string is handed out every interval, rather than
+    being concatenated again
     """
-    data = {}
-    for key, value in obj.__dict__.iteritems():
 
-        if key.startswith('_'):
-            continue
+    def __init__(self, separator='.', max_keys=65536):
+        self.separator = separator
+        self.max_keys = max_keys
+        self._keys = {}         # (prefix, key) -> joined key
 
-        try:
-            data[key] = todict(value)
-        except AttributeError:
-            data[key] = value
-    
-    return data
+    def _join(self, prefix, key):
+
+        if len(self._keys) >= self.max_keys:
+            # keys of devices etc that have gone away, start over
+            self._keys = {}
+
+        if prefix:
+            joined = prefix + self.separator + key
+        else:
+            joined = key
+        self._keys[(prefix, key)] = joined
+        return joined
+
+    def items(self, data, prefix=''):
+        """
+        :param data: (dict) nested dict to flatten
+        :param prefix: (str) prefix for the keys
+        :return: (generator) of (flattened key, value) tuples
+        """
+
+        keys = self._keys
+        stack = [(prefix, data.iteritems())]
+        while stack:
+            prefix, items = stack[-1]
+            for key, value in items:
+                joined = keys.get((prefix, key))
+                if joined is None:
+                    joined = self._join(prefix, key)
+
+                if isinstance(value, dict):
+                    stack.append((joined, value.iteritems()))
+                    break
+                yield joined, value
+            else:
+                stack.pop()
+
+
+def concurrent_map(func, items, max_workers=8, timeout=None):
+    """
+    Call func for each item, using a bounded set of worker threads
+    :param func: (callable) function to call with each item
+    :param items: (list) items to process - must be hashable
+    :param max_workers: (int) maximum number of threads to use
+    :param timeout: (float) secs to wait for all calls to complete, None
+                    waits for all calls
+    :return: (dict) item -> result, for each call that completed in time and
+             didn't raise an exception
+    """
+
+    results = {}
+    if not items:
+        return results
+
+    logger = logging.getLogger('cephmetrics')
+    work = Queue.Queue()
+    for item in items:
+        work.put(item)
+
+    def worker():
+        while True:
+            try:
+                item = work.get_nowait()
+            except Queue.Empty:
+                return
+
+            try:
+                results[item] = func(item)
+            except Exception:
+                logger.exception("call for '{}' failed".format(item))
+
+    threads = [threading.Thread(target=worker)
+               for _n in range(min(max_workers, len(items)))]
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+
+    deadline = time.time() + timeout if timeout is not None else None
+    for thread in threads:
+        if deadline is None:
+            thread.join()
+        else:
+            thread.join(max(deadline - time.time(), 0))
+
+    if any(thread.is_alive() for thread in threads):
+        # out of time, so stop any remaining work being picked up
+        while not work.empty():
+            try:
+                work.get_nowait()
+            except Queue.Empty:
+                break
+
+    # return a copy, so calls that complete late don't change the result
+    return dict(results)
+
+
+def record_dumper(fields):
+    """
+    Build the dump routine of a __slots__ based record. The fields are read
+    with a single attrgetter, rather than by reflecting over the instance,
+    and fields holding None are left out
+    :param fields: (tuple) names of the fields to dump
+    :return: (function) taking a record, returning a dict of it's fields
+    """
+
+    fields = tuple(fields)
+    getter = operator.attrgetter(*fields)
+    if len(fields) == 1:
+        values = lambda record: (getter(record), )
+    else:
+        values = getter
+
+    def dump(record):
+        return {name: value
+                for name, value in zip(fields, values(record))
+                if value is not None}
+
+    return dump
 
 
 def fread(file_name=None):
@@ -111,20 +316,49 @@ def fread(file_name=None):
         return ''
 
 
-def freadlines(file_name=None):
+def get_slaves(dev_name):
     """
-    simple readlines function to return all records of a given file
-    :param file_name: (str) file name to read
-    :return: (list) contents of the file, empty if file doesn't exist
+    Resolve a block device to the devices at the bottom of it's device
+    mapper stack e.g. an LVM volume on a dm-crypt device resolves to the
+    partition or disk the crypt device sits on
+    :param dev_name: (str) kernel device name e.g. dm-3
+    :return: (list) kernel device names, just dev_name for a device that
+             isn't stacked on anything
     """
 
-    if os.path.exists(file_name):
-        with open(file_name, 'r') as f:
-            data = f.readlines()
-        return data
-    else:
-        return []
+    try:
+        slaves = sorted(os.listdir(
+            '/sys/class/block/{}/slaves'.format(dev_name)))
+    except OSError:
+        slaves = []
+
+    if not slaves:
+        return [dev_name]
+
+    devices = []
+    for slave in slaves:
+        for device in get_slaves(slave):
+            if device not in devices:
+                devices.append(device)
+    return devices
+
+
+def is_dm_crypt(dev_name):
+    """
+    Check whether a block device is, or is stacked on, a dm-crypt device
+    :param dev_name: (str) kernel device name
+    :return: (bool) True if the device is encrypted
+    """
+
+    dm_uuid = fread('/sys/class/block/{}/dm/uuid'.format(dev_name))
+    if dm_uuid.startswith('CRYPT-'):
+        return True
 
+    try:
+        slaves = os.listdir('/sys/class/block/{}/slaves'.format(dev_name))
+    except OSError:
+        return False
+    return any(is_dm_crypt(slave) for slave in slaves)
 
 
 class IOstat(object):
@@ -157,57 +391,525 @@ class IOstat(object):
         "w_await": ("w_await", "gauge"),
     }
 
-    def __init__(self):
-        self._previous = []
-        self._current = []
+    # peak and 95th percentile of sub-interval samples, set by a DiskSampler
+    sampler_metrics = ("iops_max", "iops_p95",
+                       "util_max", "util_p95",
+                       "await_max", "await_p95")
+
+    fields = tuple(sorted(metrics)) + sampler_metrics
+
+    __slots__ = fields
 
+    def __init__(self):
         # Seed the metrics we're interested in
         for ctr in IOstat.metrics.keys():
             setattr(self, ctr, 0)
 
+        for ctr in IOstat.sampler_metrics:
+            setattr(self, ctr, None)
+
     def __str__(self):
         s = '\n- IOstat object:\n'
-        for key in sorted(vars(self)):
-            s += '\t{} ... {}\n'.format(key, getattr(self, key))
+        for key in sorted(IOstat.__slots__):
+            s += '\t{} ... {}\n'.format(key, getattr(self, key, None))
         return s
 
-    def _calc_raw_delta(self):
-        if not self._previous:
-            # nothing to compute yet
-            for ptr in range(len(IOstat.raw_metrics)):
-                key = IOstat.raw_metrics[ptr]
-                setattr(self, key, 0)
+    dump = record_dumper(fields)
+
+
+class DiskStats(object):
+    """
+    Host wide iostat engine. The raw /proc/diskstats counters of every
+    tracked device are held in flat arrays (one row of fields per device),
+    so the iostats of all devices are computed in a single pass - with numpy
+    when it's available. The results are written back to each device's
+    IOstat object, so they're dumped as before.
+
+    Each device's counters carry the monotonic time they were read at, and
+    rates are normalized to the exact time between a device's samples. An
+    interval outside min_interval - max_interval (secs) isn't reported
+    """
+
+    fields = len(IOstat.raw_metrics)
+
+    # raw field offsets within a device's row
+    reads, sectors_read, read_ms = 0, 2, 3
+    writes, sectors_written, write_ms = 4, 6, 7
+    ms_active_io = 9
+
+    results = ("iops", "r_iops", "w_iops",
+               "bytes_per_sec", "r_bytes_per_sec", "w_bytes_per_sec",
+               "util", "await", "r_await", "w_await")
+
+    no_results = (None, ) * len(results)
+
+    def __init__(self, min_interval=0.05, max_interval=300):
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self._devices = []              # slot -> IOstat
+        self.slots = {}                 # dev_name -> slot
+        self._current = array('d')
+        self._previous = array('d')
+        self._current_ts = array('d')   # slot -> monotonic time of sample
+        self._previous_ts = array('d')
+        self._samples = array('i')      # slot -> samples taken
+        self.generation = 0             # bumped when devices change
+        load_numpy()
+
+    def __len__(self):
+        return len(self._devices)
+
+    def add(self, dev_name, iostat=None):
+        if dev_name in self.slots:
+            return
+        self.slots[dev_name] = len(self._devices)
+        self.generation += 1
+        self._devices.append(iostat)
+        self._current.extend([0] * DiskStats.fields)
+        self._previous.extend([0] * DiskStats.fields)
+        self._current_ts.append(0)
+        self._previous_ts.append(0)
+        self._samples.append(0)
+
+    def remove(self, dev_name):
+        slot = self.slots.pop(dev_name, None)
+        if slot is None:
+            return
+
+        start = slot * DiskStats.fields
+        end = start + DiskStats.fields
+        del self._devices[slot]
+        del self._current[start:end]
+        del self._previous[start:end]
+        del self._current_ts[slot]
+        del self._previous_ts[slot]
+        del self._samples[slot]
+        self.generation += 1
+
+        for name in self.slots:
+            if self.slots[name] > slot:
+                self.slots[name] -= 1
+
+    def begin(self):
+        """
+        start a new sample, the current counters become the previous ones
+        """
+        self._previous[:] = self._current
+        self._previous_ts[:] = self._current_ts
+
+    def set(self, dev_name, raw_stats, timestamp):
+        """
+        record a device's counters for this sample
+        :param dev_name: (str) device name
+        :param raw_stats: (list) /proc/diskstats fields after the device name
+        :param timestamp: (float) monotonic time the counters were read
+        """
+
+        slot = self.slots[dev_name]
+        base = slot * DiskStats.fields
+        current = self._current
+        for ptr in range(DiskStats.fields):
+            current[base + ptr] = float(raw_stats[ptr])
+        self._current_ts[slot] = timestamp
+        self._samples[slot] += 1
+
+    def _valid(self, slot):
+        # a device needs two samples, a sensible time apart
+        if self._samples[slot] < 2:
+            return False
+        interval = self._current_ts[slot] - self._previous_ts[slot]
+        return self.min_interval <= interval <= self.max_interval
+
+    def _compute_numpy(self):
+
+        rows = len(self._devices)
+        current = numpy.frombuffer(self._current,
+                                   dtype=numpy.float64).reshape(rows, -1)
+        previous = numpy.frombuffer(self._previous,
+                                    dtype=numpy.float64).reshape(rows, -1)
+        interval = (numpy.frombuffer(self._current_ts, dtype=numpy.float64) -
+                    numpy.frombuffer(self._previous_ts, dtype=numpy.float64))
+        samples = numpy.frombuffer(self._samples, dtype=numpy.intc)
+
+        valid = ((samples > 1) & (interval >= self.min_interval) &
+                 (interval <= self.max_interval))
+        interval = numpy.where(valid, interval, 1.0)
+
+        delta = current - previous
+        reads = delta[:, DiskStats.reads]
+        writes = delta[:, DiskStats.writes]
+        read_ms = delta[:, DiskStats.read_ms]
+        write_ms = delta[:, DiskStats.write_ms]
+        total_io = reads + writes
+
+        r_bytes_per_sec = (delta[:, DiskStats.sectors_read] *
+                           IOstat.sector_size / interval)
+        w_bytes_per_sec = (delta[:, DiskStats.sectors_written] *
+                           IOstat.sector_size / interval)
+
+        def per_io(ms, ios):
+            return numpy.where(ios > 0, ms / numpy.maximum(ios, 1), 0)
+
+        results = numpy.column_stack((
+            total_io / interval,
+            reads / interval,
+            writes / interval,
+            r_bytes_per_sec + w_bytes_per_sec,
+            r_bytes_per_sec,
+            w_bytes_per_sec,
+            delta[:, DiskStats.ms_active_io] / (interval * 1000.0) * 100,
+            per_io(read_ms + write_ms, total_io),
+            per_io(read_ms, reads),
+            per_io(write_ms, writes))).tolist()
+
+        return [values if is_valid else None
+                for values, is_valid in zip(results, valid.tolist())]
+
+    def _compute_array(self):
+
+        current = self._current
+        previous = self._previous
+        sector_size = IOstat.sector_size
+
+        results = []
+        for slot in range(len(self._devices)):
+            if not self._valid(slot):
+                results.append(None)
+                continue
+
+            interval = self._current_ts[slot] - self._previous_ts[slot]
+            base = slot * DiskStats.fields
+            reads = current[base] - previous[base]
+            writes = (current[base + DiskStats.writes] -
+                      previous[base + DiskStats.writes])
+            read_ms = (current[base + DiskStats.read_ms] -
+                       previous[base + DiskStats.read_ms])
+            write_ms = (current[base + DiskStats.write_ms] -
+                        previous[base + DiskStats.write_ms])
+            total_io = reads + writes
+
+            r_bytes_per_sec = (current[base + DiskStats.sectors_read] -
+                               previous[base + DiskStats.sectors_read]
+                               ) * sector_size / interval
+            w_bytes_per_sec = (current[base + DiskStats.sectors_written] -
+                               previous[base + DiskStats.sectors_written]
+                               ) * sector_size / interval
+            ms_active_io = (current[base + DiskStats.ms_active_io] -
+                            previous[base + DiskStats.ms_active_io])
+
+            results.append((
+                total_io / interval,
+                reads / interval,
+                writes / interval,
+                r_bytes_per_sec + w_bytes_per_sec,
+                r_bytes_per_sec,
+                w_bytes_per_sec,
+                ms_active_io / (interval * 1000.0) * 100,
+                (read_ms + write_ms) / total_io if total_io > 0 else 0,
+                read_ms / reads if reads > 0 else 0,
+                write_ms / writes if writes > 0 else 0))
+
+        return results
+
+    def calculate(self):
+        """
+        Calculate the iostats of all devices since their last sample
+        :return: (list) per slot, the values of each DiskStats.results or
+                 None when the device's interval isn't usable
+        """
+
+        if not self._devices:
+            return []
+
+        if numpy is not None:
+            return self._compute_numpy()
         else:
-            for ptr in range(len(IOstat.raw_metrics)):
-                key = IOstat.raw_metrics[ptr]
-                setattr(self, key, (int(self._current[ptr]) -
-                                    int(self._previous[ptr])))
+            return self._compute_array()
 
-    def compute(self, sample_interval):
+    def compute(self):
         """
-        Calculate the iostats for this device
+        Calculate the iostats of all devices since their last sample, and
+        update each device's IOstat object. Devices without a usable
+        interval have their iostats cleared so they aren't dumped, rather
+        than reporting zeros or a misleading rate
         """
 
-        self._calc_raw_delta()
-
-        if sample_interval > 0:
-            interval_ms = sample_interval * 1000
-            total_io = self._reads + self._writes
-            self.util = float(self._ms_active_io) / interval_ms * 100
-            self.iops = int(total_io) / sample_interval
-            self.r_iops = int(self._reads) / sample_interval
-            self.w_iops = int(self._writes) / sample_interval
-            self.await = float(
-                self._write_ms + self._read_ms) / total_io if total_io > 0 else 0
-            self.w_await = float(
-                self._write_ms) / self._writes if self._writes > 0 else 0
-            self.r_await = float(
-                self._read_ms) / self._reads if self._reads > 0 else 0
-            self.r_bytes_per_sec = (float(
-                self._sectors_read * IOstat.sector_size)) / sample_interval
-            self.w_bytes_per_sec = (float(
-                self._sectors_written * IOstat.sector_size)) / sample_interval
-            self.bytes_per_sec = self.r_bytes_per_sec + self.w_bytes_per_sec
+        results = self.calculate()
+        for iostat, values in zip(self._devices, results):
+            if iostat is None:
+                continue
+            if values is None:
+                values = DiskStats.no_results
+            for name, value in zip(DiskStats.results, values):
+                setattr(iostat, name, value)
+
+
+class DiskStatsReader(object):
+    """
+    Reads /proc/diskstats for a DiskStats engine. The file is kept open and
+    re-read from the start into a reusable buffer each time. The tracked
+    devices are indexed in file order, so each read finds their lines with a
+    forward search of the buffer, and only those lines are copied and split
+    - the (often hundreds of) partition, dm and loop entries of a host are
+    never parsed. The index is rebuilt when the tracked devices or the
+    file's devices change
+    """
+
+    def __init__(self, disk_stats, file_name='/proc/diskstats',
+                 buffer_size=65536):
+        self.disk_stats = disk_stats
+        self.file_name = file_name
+        self._file = None
+        self._buffer = bytearray(buffer_size)
+        self._generation = None
+        self._line_count = 0
+        self._index = []        # (dev_name, search token) in file order
+
+    @staticmethod
+    def _token(dev_name):
+        # the name field is the only one that isn't numeric, and is space
+        # delimited e.g. ' sda ' doesn't match sda1
+        return ' {} '.format(dev_name).encode('ascii')
+
+    def _build_index(self, length, line_count):
+        buf = self._buffer
+        found = []
+        for dev_name in self.disk_stats.slots:
+            token = DiskStatsReader._token(dev_name)
+            offset = buf.find(token, 0, length)
+            if offset >= 0:
+                found.append((offset, dev_name, token))
+
+        self._index = [(dev_name, dev_token)
+                       for _offset, dev_name, dev_token in sorted(found)]
+        self._line_count = line_count
+        self._generation = self.disk_stats.generation
+
+    def _parse(self, length):
+        """
+        :param length: (int) bytes of the file held in the buffer
+        :return: (list) of (dev_name, raw stats) for the tracked devices, or
+                 None if the index doesn't match the file
+        """
+
+        buf = self._buffer
+        records = []
+        pos = 0
+        for dev_name, token in self._index:
+            start = buf.find(token, pos, length)
+            if start < 0:
+                return None
+            end = buf.find(b'\n', start, length)
+            if end < 0:
+                end = length
+            records.append((dev_name, bytes(buf[start:end]).split()[1:]))
+            pos = end
+        return records
+
+    def _read(self):
+        """
+        read the whole file into the buffer
+        :return: (tuple) bytes read, and the monotonic time of the read
+        """
+
+        if self._file is None:
+            self._file = io.FileIO(self.file_name, 'r')
+
+        self._file.seek(0)
+        length = 0
+        while True:
+            view = memoryview(self._buffer)[length:]
+            received = self._file.readinto(view)
+            if not received:
+                break
+            length += received
+            del view
+            if length == len(self._buffer):
+                # the buffer is full, so there may be more to read
+                self._buffer.extend(bytearray(len(self._buffer)))
+
+        return length, monotonic()
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def read(self):
+        """
+        update the engine with the current counters of the tracked devices
+        :return: (int) number of devices updated
+        """
+
+        if not self.disk_stats.slots:
+            return 0
+
+        length, timestamp = self._read()
+
+        line_count = self._buffer.count(b'\n', 0, length)
+        if (self._generation != self.disk_stats.generation or
+                line_count != self._line_count):
+            self._build_index(length, line_count)
+
+        records = self._parse(length)
+        if records is None:
+            # the host's devices have changed since the index was built
+            self._build_index(length, line_count)
+            records = self._parse(length)
+
+        for dev_name, raw_stats in records:
+            self.disk_stats.set(dev_name, raw_stats, timestamp)
+
+        return len(records)
+
+
+class DiskSampler(threading.Thread):
+    """
+    Background sampler of /proc/diskstats, for the short bursts that are
+    averaged away over a collection interval. The iostats of each tracked
+    device are calculated at every sample and held in fixed size ring
+    buffers, so memory use is constant. When drained, the peak and 95th
+    percentile of the samples since the last drain are written to each
+    device's IOstat object, or left out of it's dump when there were no
+    samples
+    """
+
+    sampled = ("iops", "util", "await")
+
+    metrics = {name: (name, "gauge") for name in IOstat.sampler_metrics}
+
+    # samples older than this (secs) are overwritten
+    window = 60
+
+    def __init__(self, rate=0.2):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.rate = rate
+        self.capacity = int(math.ceil(DiskSampler.window / rate))
+
+        # skip intervals stretched by a stalled sampler, they're no longer
+        # a short burst
+        self.disk_stats = DiskStats(min_interval=rate / 2.0,
+                                    max_interval=rate * 10)
+        self.reader = DiskStatsReader(self.disk_stats)
+        self._iostats = {}      # dev_name -> IOstat to report the results in
+        self._rings = {}        # dev_name -> [array per sampled metric]
+        self._counts = {}       # dev_name -> samples since the last drain
+        self._positions = {}    # dev_name -> next ring position
+
+        self._busy = 0.0        # secs spent sampling since the last drain
+        self._drained = monotonic()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+
+        self.logger = logging.getLogger('cephmetrics')
+
+        self._columns = [DiskStats.results.index(name)
+                         for name in DiskSampler.sampled]
+
+    def add(self, dev_name, iostat):
+        with self._lock:
+            self.disk_stats.add(dev_name)
+            self._iostats[dev_name] = iostat
+            self._rings[dev_name] = [array('d', [0]) * self.capacity
+                                     for _name in DiskSampler.sampled]
+            self._counts[dev_name] = 0
+            self._positions[dev_name] = 0
+
+    def remove(self, dev_name):
+        with self._lock:
+            self.disk_stats.remove(dev_name)
+            self._iostats.pop(dev_name, None)
+            self._rings.pop(dev_name, None)
+            self._counts.pop(dev_name, None)
+            self._positions.pop(dev_name, None)
+
+    def stop(self):
+        self._stop.set()
+
+    def _sample(self):
+
+        self.disk_stats.begin()
+        self.reader.read()
+
+        results = self.disk_stats.calculate()
+        for dev_name, slot in self.disk_stats.slots.items():
+            values = results[slot]
+            if values is None:
+                continue
+            pos = self._positions[dev_name]
+            for ring, column in zip(self._rings[dev_name], self._columns):
+                ring[pos] = values[column]
+            self._positions[dev_name] = (pos + 1) % self.capacity
+            self._counts[dev_name] += 1
+
+    def run(self):
+
+        next_sample = monotonic()
+        while not self._stop.is_set():
+            start = monotonic()
+            with self._lock:
+                try:
+                    self._sample()
+                except (IOError, OSError) as e:
+                    self.logger.error("disk sampler failed : {}".format(e))
+            end = monotonic()
+            self._busy += end - start
+
+            next_sample += self.rate
+            if next_sample < end:
+                # fallen behind, so skip the missed samples
+                next_sample = end
+            self._stop.wait(next_sample - end)
+
+    @staticmethod
+    def summarize(values):
+        """
+        :param values: (list) samples
+        :return: (tuple) max and 95th percentile of the samples, or Nones
+                 when there are no samples to summarize
+        """
+
+        if not values:
+            return None, None
+        values = sorted(values)
+        p95 = values[int(math.ceil(len(values) * 0.95)) - 1]
+        return values[-1], p95
+
+    def drain(self):
+        """
+        Report the peak and 95th percentile of each device's samples since
+        the last drain, in the device's IOstat object
+        :return: (float) % of the time since the last drain spent sampling,
+                 the sampler's overhead
+        """
+
+        with self._lock:
+            now = monotonic()
+            for dev_name, rings in self._rings.items():
+                count = min(self._counts[dev_name], self.capacity)
+                self._counts[dev_name] = 0
+                iostat = self._iostats[dev_name]
+                pos = self._positions[dev_name]
+
+                for name, ring in zip(DiskSampler.sampled, rings):
+                    # the last count samples, oldest first
+                    start = pos - count
+                    if start >= 0:
+                        values = ring[start:pos]
+                    else:
+                        values = ring[start:] + ring[:pos]
+
+                    peak, p95 = DiskSampler.summarize(values)
+                    setattr(iostat, '{}_max'.format(name), peak)
+                    setattr(iostat, '{}_p95'.format(name), p95)
+
+            elapsed = now - self._drained
+            busy_pct = self._busy / elapsed * 100 if elapsed > 0 else 0
+            self._busy = 0.0
+            self._drained = now
+
+        return busy_pct
 
 
 class Disk(object):
@@ -221,6 +923,10 @@ class Disk(object):
     osd_types = {"filestore": 0,
                 "bluestore": 1}
 
+    fields = ("osd_id", "rotational", "disk_size", "encrypted", "osd_type")
+
+    __slots__ = ("_name", "_path_name", "_base_dev", "perf") + fields
+
     def __init__(self, device_name, path_name=None, osd_id=None,
                  in_osd_type="filestore", encrypted=0):
 
@@ -235,6 +941,13 @@ class Disk(object):
         self.encrypted = encrypted
         self.osd_type = Disk.osd_types[in_osd_type]
 
+    _dump_fields = record_dumper(fields)
+
+    def dump(self):
+        data = self._dump_fields()
+        data['perf'] = self.perf.dump()
+        return data
+
     def _get_size(self):
         size = fread("/sys/block/{}/size".format(self._base_dev))
         if size.isdigit():
@@ -255,6 +968,14 @@ class Disk(object):
     @staticmethod
     def get_base_dev(dev_name):
 
+        # a partition's sysfs entry sits within the entry of it's disk
+        sys_path = '/sys/class/block/{}'.format(dev_name)
+        if os.path.exists(os.path.join(sys_path, 'partition')):
+            return os.path.basename(
+                os.path.dirname(os.path.realpath(sys_path)))
+        elif os.path.exists(sys_path):
+            return dev_name
+
         # for intelcas devices, just use the device name as is
         if dev_name.startswith('intelcas'):
             device = dev_name
@@ -11,11 +11,13 @@ import sys
 import time
 
 from collectors.base import BaseCollector
-from collectors.common import fread
+from collectors.common import fread, record_dumper
 
 
 class Client(object):
 
+    __slots__ = ("iqn", "name", "luns", "lun_count", "_cycle")
+
     def __init__(self, iqn):
         self.iqn = iqn
         self.name = iqn.replace('.', '-')
@@ -24,10 +26,7 @@ class Client(object):
         self._cycle = 0
 
     def dump(self):
-        client_dump = {}
         lun_info = {}
-        client_dump[self.name] = {"luns": {},
-                                  "lun_count": self.lun_count}
         for lun_name in self.luns:
             lun = self.luns[lun_name]
             lun_info.update(lun.dump())
@@ -39,6 +38,12 @@ class Client(object):
 
 class LUN(object):
 
+    fields = ("size", "iops", "read_bytes_per_sec", "write_bytes_per_sec",
+              "total_bytes_per_sec", "active_path")
+
+    __slots__ = ("_path", "_tpg_lun", "_name", "_display_name", "_so",
+                 "_client", "_cycle") + fields
+
     def __init__(self, client, tpg_lun):
         self._path = tpg_lun.storage_object.path
         self._tpg_lun = tpg_lun
@@ -71,9 +76,10 @@ class LUN(object):
         else:
             self.active_path = 0
 
+    _dump_fields = record_dumper(fields)
+
     def dump(self):
-        return {self._display_name: {k: getattr(self, k) for k in self.__dict__
-                                     if not k.startswith("_")}}
+        return {self._display_name: self._dump_fields()}
 
 
 class ISCSIGateway(BaseCollector):
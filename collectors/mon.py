@@ -3,13 +3,15 @@
 import rados
 import rbd
 import json
+import errno
 import threading
+import contextlib
 import time
 import logging
-import requests
 
 from collectors.base import BaseCollector
-from collectors.common import merge_dicts, get_hostname, get_names
+from collectors.common import (merge_dicts, get_hostname, get_names,
+                               concurrent_map)
 
 
 class CephState(object):
@@ -58,28 +60,265 @@ class CephState(object):
                                 ','.join(self.summary))
 
 
+class RadosConnection(object):
+    """
+    Long lived connection to the cluster, shared by the Mon collector and
+    it's RBD scanners. librados handles are thread safe, so one connection
+    is used by all threads instead of a connect (cephx auth + monmap fetch)
+    for every command.
+
+    Callers hold the handle for the duration of their request (see handle),
+    so when a failed connection is replaced the old handle is only shut down
+    once the last thread using it has released it
+    """
+
+    # mon_command return codes that suggest the connection itself is bad
+    reconnect_errors = (-errno.ETIMEDOUT, -errno.ENOTCONN, -errno.ESHUTDOWN)
+
+    def __init__(self, cluster_name, timeout=10):
+        self.conf_file = "/etc/ceph/{}.conf".format(cluster_name)
+        self.timeout = timeout
+        self.cluster = None
+        self._users = {}        # id(handle) -> count of requests using it
+        self._retired = {}      # id(handle) -> replaced handle still in use
+        self._lock = threading.Lock()
+        self.logger = logging.getLogger('cephmetrics')
+
+    @property
+    def connected(self):
+        return self.cluster is not None and self.cluster.state == 'connected'
+
+    @contextlib.contextmanager
+    def handle(self):
+        """
+        Use the current connection, establishing a new one if the current
+        one has been lost. The handle stays valid until the block exits
+        :return: (rados.Rados) connected cluster handle
+        """
+
+        cluster = self._acquire()
+        try:
+            yield cluster
+        finally:
+            self._release(cluster)
+
+    def _acquire(self):
+
+        with self._lock:
+            if not self.connected:
+                stale = self._retire(self.cluster)
+
+                start = time.time()
+                cluster = rados.Rados(conffile=self.conf_file)
+                cluster.connect(timeout=self.timeout)
+                self.cluster = cluster
+                end = time.time()
+
+                self.logger.info("connected to the cluster in "
+                                 "{:.3f}s".format(end - start))
+            else:
+                stale = None
+
+            key = id(self.cluster)
+            self._users[key] = self._users.get(key, 0) + 1
+            cluster = self.cluster
+
+        self._shutdown(stale)
+        return cluster
+
+    def _release(self, cluster):
+
+        stale = None
+        with self._lock:
+            key = id(cluster)
+            self._users[key] -= 1
+            if not self._users[key]:
+                del self._users[key]
+                stale = self._retired.pop(key, None)
+
+        self._shutdown(stale)
+
+    def _retire(self, cluster):
+        """
+        Detach a handle from the connection (lock held)
+        :return: (rados.Rados) the handle if it can be shut down now, or None
+                 when it's still in use, and it's last user will shut it down
+        """
+
+        if cluster is None:
+            return None
+
+        if cluster is self.cluster:
+            self.cluster = None
+
+        if id(cluster) in self._users:
+            self._retired[id(cluster)] = cluster
+            return None
+
+        return cluster
+
+    @staticmethod
+    def _shutdown(cluster):
+        if cluster is not None:
+            try:
+                cluster.shutdown()
+            except rados.Error:
+                pass
+
+    def reset(self, cluster):
+        """
+        drop a failed handle, so the next request reconnects. If another
+        thread has already replaced the handle there's nothing to do
+        :param cluster: (rados.Rados) the handle the request failed on
+        """
+
+        with self._lock:
+            stale = None
+            if cluster is not None and cluster is self.cluster:
+                stale = self._retire(cluster)
+
+        self._shutdown(stale)
+
+    def mon_command(self, cmd):
+        """
+        Issue a mon command, reconnecting and retrying once if the connection
+        has failed
+        :param cmd: (str) json encoded command
+        :return: (tuple) rc, output buffer, status string
+        """
+
+        for attempt in (1, 2):
+            cluster = None
+            try:
+                with self.handle() as cluster:
+                    rc, buf_s, out = cluster.mon_command(cmd, b'',
+                                                         timeout=self.timeout)
+            except rados.Error as e:
+                self.logger.warning("mon_command failed ({}), "
+                                    "reconnecting".format(e))
+                self.reset(cluster)
+                if attempt == 2:
+                    raise
+            else:
+                if rc in RadosConnection.reconnect_errors and attempt == 1:
+                    self.logger.warning("mon_command returned {} ({}), "
+                                        "reconnecting".format(rc, out))
+                    self.reset(cluster)
+                    continue
+                return rc, buf_s, out
+
+    def list_pools(self):
+        cluster = None
+        try:
+            with self.handle() as cluster:
+                return cluster.list_pools()
+        except rados.Error:
+            self.reset(cluster)
+            with self.handle() as cluster:
+                return cluster.list_pools()
+
+
 class RBDScanner(threading.Thread):
+    """
+    Long running thread that maintains the rbd image count for a set of
+    pools. A pool is rescanned when it's object count changes or it's count
+    is older than the ttl, so the count is always the result of a complete
+    scan and large pools never hold up the read cycle
+    """
+
+    # minimum secs between scans of the same pool, so a busy pool (whose
+    # object count is always changing) isn't rescanned back to back
+    min_rescan = 60
+
+    def __init__(self, connection, ttl=300):
+        threading.Thread.__init__(self)
+        self.daemon = True
 
-    def __init__(self, cluster_name, pool_name):
-        self.cluster_name = cluster_name
-        self.pool_name = pool_name
-        self.num_rbds = 0
+        self.connection = connection
+        self.ttl = ttl
         self.logger = logging.getLogger('cephmetrics')
 
-        threading.Thread.__init__(self)
+        # pool_name -> {"num_rbds": int, "scanned": timestamp, "objects": int}
+        self.pools = {}
+        self._wanted = {}       # pool_name -> object count
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
 
-    def run(self):
+    def update(self, pool_objects):
+        """
+        define the pools to maintain counts for
+        :param pool_objects: (dict) pool name -> current object count
+        """
+
+        with self._lock:
+            self._wanted = dict(pool_objects)
+            for pool_name in list(self.pools):
+                if pool_name not in self._wanted:
+                    del self.pools[pool_name]
+
+        self._wakeup.set()
+
+    def counts(self):
+        """
+        :return: (dict) pool name -> (rbd count, secs since the count was
+                 taken) for each pool scanned so far
+        """
+
+        now = time.time()
+        with self._lock:
+            return {pool_name: (entry['num_rbds'], now - entry['scanned'])
+                    for pool_name, entry in self.pools.items()}
+
+    def _needs_scan(self, pool_name, objects, now):
+        entry = self.pools.get(pool_name)
+        if entry is None:
+            return True
+
+        age = now - entry['scanned']
+        if age >= self.ttl:
+            return True
+
+        return entry['objects'] != objects and age >= RBDScanner.min_rescan
+
+    def _scan(self, pool_name):
         rbd_images = []
-        conf_file = "/etc/ceph/{}.conf".format(self.cluster_name)
-        self.logger.debug("scan of '{}' starting".format(self.pool_name))
-        with rados.Rados(conffile=conf_file) as cluster:
-            with cluster.open_ioctx(self.pool_name) as ioctx:
+        self.logger.debug("scan of '{}' starting".format(pool_name))
+        with self.connection.handle() as cluster:
+            with cluster.open_ioctx(pool_name) as ioctx:
                 rbd_inst = rbd.RBD()
-                self.logger.debug("listing rbd's in {}".format(self.pool_name))
+                self.logger.debug("listing rbd's in {}".format(pool_name))
                 rbd_images = rbd_inst.list(ioctx)
 
-        self.logger.info("pool scan complete for '{}'".format(self.pool_name))
-        self.num_rbds = len(rbd_images)
+        self.logger.info("pool scan complete for '{}'".format(pool_name))
+        return len(rbd_images)
+
+    def run(self):
+
+        while True:
+            self._wakeup.wait(self.ttl)
+            self._wakeup.clear()
+
+            with self._lock:
+                wanted = dict(self._wanted)
+
+            for pool_name in sorted(wanted):
+                objects = wanted[pool_name]
+                if not self._needs_scan(pool_name, objects, time.time()):
+                    continue
+
+                try:
+                    num_rbds = self._scan(pool_name)
+                except Exception as e:
+                    # keep the last good count, and try again next time
+                    self.logger.warning("scan of '{}' failed : "
+                                        "{}".format(pool_name, e))
+                    continue
+
+                with self._lock:
+                    if pool_name in self._wanted:
+                        self.pools[pool_name] = {"num_rbds": num_rbds,
+                                                 "scanned": time.time(),
+                                                 "objects": objects}
 
 
 class Mon(BaseCollector):
@@ -136,6 +375,11 @@ class Mon(BaseCollector):
         'read_op_per_sec': ("read_op_per_sec", "gauge")
     }
 
+    pool_rbd_metrics = {
+        "num_rbds": ("num_rbds", "gauge"),
+        "rbd_scan_age": ("rbd_scan_age", "gauge")
+    }
+
     pool_recovery_metrics = {
         "recovering_objects_per_sec": ("recovering_objects_per_sec", "gauge"),
         "recovering_bytes_per_sec": ("recovering_bytes_per_sec", "gauge"),
@@ -149,9 +393,26 @@ class Mon(BaseCollector):
         "mon_status": ("mon_status", "gauge")
     }
 
+    # this mon's own state, reported by every mon
+    local_metrics = {
+        "state": ("state", "gauge"),
+        "rank": ("rank", "gauge"),
+        "in_quorum": ("in_quorum", "gauge")
+    }
+
+    local_states = {
+        "leader": 0,
+        "peon": 1,
+        "electing": 2,
+        "synchronizing": 3,
+        "probing": 4
+    }
+
     all_metrics = merge_dicts(pool_recovery_metrics, pool_client_metrics)
     all_metrics = merge_dicts(all_metrics, cluster_metrics)
     all_metrics = merge_dicts(all_metrics, mon_states)
+    all_metrics = merge_dicts(all_metrics, pool_rbd_metrics)
+    all_metrics = merge_dicts(all_metrics, local_metrics)
 
     def __init__(self, *args, **kwargs):
         BaseCollector.__init__(self, *args, **kwargs)
@@ -164,10 +425,33 @@ class Mon(BaseCollector):
 
         self.ip_names = get_names()
 
-        if self.version < 12:
-            self.get_mon_health = self._mon_health
-        else:
-            self.get_mon_health = self._mon_health_new
+        self.rados = RadosConnection(self.cluster_name)
+
+        # osd dump and pool list results, which only change when the osd map
+        # epoch moves
+        self.osd_map = {"epoch": None,
+                        "num_osd_hosts": 0,
+                        "osd_states": {}}
+        self.pool_list = {"epoch": None,
+                          "pools": []}
+
+        # started on first use
+        self.rbd_scanner = None
+        self.rbd_scan_ttl = RBDScanner.min_rescan * 5
+        if self._parent and self._parent.rbd_scan_ttl:
+            self.rbd_scan_ttl = self._parent.rbd_scan_ttl
+
+        # in 'status' mode the pg, health and monmap data are all taken from
+        # a single status command
+        self.query_mode = 'commands'
+        if self._parent and self._parent.mon_query_mode == 'status':
+            self.query_mode = 'status'
+
+        # 'all' mons or just the quorum 'leader' gather the cluster wide
+        # metrics
+        self.cluster_stats = 'all'
+        if self._parent:
+            self.cluster_stats = self._parent.mon_cluster_stats
 
 
 
@@ -179,12 +463,10 @@ class Mon(BaseCollector):
         """ Issue a command to the monitor """
 
         buf_s = '{}'
-        conf_file = "/etc/ceph/{}.conf".format(self.cluster_name)
 
         start = time.time()
-        with rados.Rados(conffile=conf_file) as cluster:
-            cmd = {'prefix': cmd_request, 'format': 'json'}
-            rc, buf_s, out = cluster.mon_command(json.dumps(cmd), b'')
+        cmd = {'prefix': cmd_request, 'format': 'json'}
+        rc, buf_s, out = self.rados.mon_command(json.dumps(cmd))
         end = time.time()
 
         self.logger.debug("_mon_command call '{}' :"
@@ -193,6 +475,59 @@ class Mon(BaseCollector):
 
         return json.loads(buf_s)
 
+    @staticmethod
+    def _status_responses(status):
+        """
+        Split the output of a 'status' command into the 'pg stat', 'health'
+        and 'mon_status' responses the health processing expects
+        :param status: (dict) output from the status command
+        :return: (dict) command prefix -> equivalent response
+        """
+
+        pgmap = status.get('pgmap', {})
+        pg_data = {"num_pg_by_state": [{"name": pg_state.get('state_name'),
+                                        "num": pg_state.get('count')}
+                                       for pg_state in
+                                       pgmap.get('pgs_by_state', [])]}
+
+        health_data = status.get('health', {})
+        if 'summary' not in health_data and 'checks' in health_data:
+            # luminous only provides the summary list with
+            # mon_health_preluminous_compat, so build one from the checks
+            checks = health_data.get('checks')
+            health_data['summary'] = [
+                {"severity": checks[check].get('severity'),
+                 "summary": checks[check].get('summary', {}).get('message')}
+                for check in checks]
+
+        mon_status = {"quorum": status.get('quorum', []),
+                      "monmap": status.get('monmap', {})}
+
+        return {
+            "pg stat": pg_data,
+            "health": health_data,
+            "mon_status": mon_status
+        }
+
+    def _mon_commands(self, cmd_list):
+        """
+        Issue a set of independent mon commands concurrently, so the elapsed
+        time is that of the slowest command rather than the sum of them all
+        :param cmd_list: (list) mon command prefixes
+        :return: (dict) command prefix -> decoded response, commands that
+                 failed are not included
+        """
+
+        start = time.time()
+        responses = concurrent_map(self._mon_command, cmd_list,
+                                   max_workers=len(cmd_list))
+        end = time.time()
+
+        self.logger.debug("{} mon commands issued : "
+                          "{:.3f}s".format(len(cmd_list), (end - start)))
+
+        return responses
+
     @staticmethod
     def get_feature_state(summary_data, pg_states):
         """
@@ -253,11 +588,29 @@ class Mon(BaseCollector):
 
         return stuck_pgs
 
-    def _mon_health_new(self, cluster_data):
+    @property
+    def health_cmds(self):
+        # the version is checked on each call, since the mon can be upgraded
+        # while collectd keeps running
+        if self.query_mode == 'status':
+            return ['status']
+        elif self.version < 12:
+            return ['pg stat', 'health']
+        else:
+            return ['pg stat', 'health', 'mon_status']
 
-        cluster, health_data = self._mon_health_common(cluster_data)
+    def get_mon_health(self, cluster_data, responses):
+        if self.version < 12:
+            return self._mon_health(cluster_data, responses)
+        else:
+            return self._mon_health_new(cluster_data, responses)
+
+    def _mon_health_new(self, cluster_data, responses):
+
+        cluster, health_data = self._mon_health_common(cluster_data,
+                                                       responses)
 
-        mon_status_output = self._mon_command('mon_status')
+        mon_status_output = responses['mon_status']
         quorum_list = mon_status_output.get('quorum')
         mon_list = mon_status_output.get('monmap').get('mons')
         mon_status = {}
@@ -273,7 +626,7 @@ class Mon(BaseCollector):
 
         return cluster
 
-    def _mon_health_common(self, cluster_data):
+    def _mon_health_common(self, cluster_data, responses):
 
         # for v12 (Luminous and beyond) add the following setting to
         # ceph.conf "mon_health_preluminous_compat=true"
@@ -282,8 +635,8 @@ class Mon(BaseCollector):
         health_data = {}
         cluster = {}
 
-        pg_data = self._mon_command("pg stat")
-        health_data = self._mon_command("health")
+        pg_data = responses["pg stat"]
+        health_data = responses["health"]
         health_text = health_data.get('status',
                                       health_data.get('overall_status', ''))
 
@@ -308,9 +661,10 @@ class Mon(BaseCollector):
     def get_cluster_state(self):
         return self._admin_socket().get('cluster', {})
 
-    def _mon_health(self, cluster_data):
+    def _mon_health(self, cluster_data, responses):
 
-        cluster, health_data = self._mon_health_common(cluster_data)
+        cluster, health_data = self._mon_health_common(cluster_data,
+                                                       responses)
 
         services = health_data.get('health').get('health_services')
         mon_status = {}
@@ -337,19 +691,23 @@ class Mon(BaseCollector):
             # event generation skipped
             return
 
-        candidates = [mon_name for mon_name in sorted(mon_status)
-                      if mon_status.get(mon_name) == 0]
-
-        if candidates:
-            sender = candidates[0]
-            if sender not in self.ip_names:
-                # only one mon should send, so if that's not us do nothing
-                return
+        if self.cluster_stats == 'leader':
+            # only the quorum leader gets this far, so it's the sender
+            pass
         else:
-            # no suitable mon to send the alert
-            self.logger.error("Unable to send ANY event - no valid mon "
-                              "found")
-            return
+            candidates = [mon_name for mon_name in sorted(mon_status)
+                          if mon_status.get(mon_name) == 0]
+
+            if candidates:
+                sender = candidates[0]
+                if sender not in self.ip_names:
+                    # only one mon should send, so if that's not us do nothing
+                    return
+            else:
+                # no suitable mon to send the alert
+                self.logger.error("Unable to send ANY event - no valid mon "
+                                  "found")
+                return
 
         # If we're here, the current host is suitable to send an event so lets
         # look deeper to see if we need to
@@ -400,6 +758,9 @@ class Mon(BaseCollector):
     @staticmethod
     def post_event(url, tag_name, event_message):
 
+        # only the mon that sends events needs requests
+        import requests
+
         headers = {"Content-Type": "application/json"}
 
         try:
@@ -429,17 +790,15 @@ class Mon(BaseCollector):
         return {metric_format[k][0]: metrics[k]
                 for k in metrics} if metrics else {}
 
-    def _get_df_stats(self):
-        """ get 'ceph df' stats from rados """
-        raw_stats = self._mon_command('df')
+    def _get_df_stats(self, raw_stats):
+        """ process 'ceph df' stats from rados """
         for pool in raw_stats['pools']:
             pool['name'] = pool['name'].replace('.', '_')
         return raw_stats
 
-    def _get_pool_stats(self):
-        """ get pool stats from rados """
+    def _get_pool_stats(self, raw_stats):
+        """ process 'osd pool stats' output from rados """
 
-        raw_stats = self._mon_command('osd pool stats')
         pool_stats = {}
 
         # process each pool
@@ -474,10 +833,8 @@ class Mon(BaseCollector):
 
         return pool_stats
 
-    def _get_osd_states(self):
+    def _get_osd_states(self, raw):
 
-        self.logger.debug("fetching osd states from the local mon")
-        raw = self._mon_command('osd dump')
         osd_hosts = set()
         osds = {}
         for osd in raw.get('osds'):
@@ -492,6 +849,17 @@ class Mon(BaseCollector):
 
         return len(osd_hosts), osds
 
+    def _update_osd_map(self, raw):
+        """
+        refresh the cached osd states from an 'osd dump' response
+        :param raw: (dict) osd dump output
+        """
+
+        num_osd_hosts, osd_states = self._get_osd_states(raw)
+        self.osd_map = {"epoch": raw.get('epoch'),
+                        "num_osd_hosts": num_osd_hosts,
+                        "osd_states": osd_states}
+
     @staticmethod
     def _select_pools(pools, mons):
         """
@@ -521,64 +889,180 @@ class Mon(BaseCollector):
 
         return pools_to_scan
 
-    def get_rbd_pools(self):
+    def get_rbd_pools(self, osd_epoch=None):
         """
         Look at the rados pools to filter out pools that would normally not
         be associated with rbd images
+        :param osd_epoch: (int) current osd map epoch. Pools are part of the
+                          osd map, so the pool list is only refreshed when
+                          the epoch changes
         :return: (list) of pools that may contain rbd images
         """
         skip_pools = ('default.rgw', '.rgw.')
 
-        start = time.time()
-        conf_file = "/etc/ceph/{}.conf".format(self.cluster_name)
-        with rados.Rados(conffile=conf_file) as cluster:
-            rados_pools = sorted(cluster.list_pools())
-        end = time.time()
+        if osd_epoch is not None and osd_epoch == self.pool_list['epoch']:
+            rados_pools = self.pool_list['pools']
+        else:
+            start = time.time()
+            rados_pools = sorted(self.rados.list_pools())
+            end = time.time()
 
-        self.logger.debug('lspools took {:.3f}s'.format(end - start))
+            self.logger.debug('lspools took {:.3f}s'.format(end - start))
+            self.pool_list = {"epoch": osd_epoch,
+                              "pools": rados_pools}
 
         filtered_pools = [pool for pool in rados_pools
                           if not pool.startswith(skip_pools)]
 
         return filtered_pools
 
-    def _get_rbds(self, monitors):
+    def _get_rbds(self, monitors, pool_objects, osd_epoch=None):
         """
-        Scan a subset of the rados pools for rbd images. Each mon collector
-        will scan a subset of the pools to distribute the load using the
-        RBSScanner class
+        Look up the rbd image counts for a subset of the rados pools. Each
+        mon collector looks after a subset of the pools to distribute the
+        load, with the counts maintained in the background by the RBDScanner
         :param monitors: (dict) monitor names and states
-        :return total_rbs: (int) total rbd images found across pools
+        :param pool_objects: (dict) pool name -> object count from ceph df
+        :param osd_epoch: (int) current osd map epoch
+        :return total_rbds: (int) total rbd images found across pools, or
+                            None until every pool has been scanned
+        :return pool_rbds: (dict) pool display name -> rbd count and the age
+                           (secs) of that count
         """
 
-        pool_list = self.get_rbd_pools()
+        pool_list = self.get_rbd_pools(osd_epoch)
         mon_list = sorted(monitors.keys())
         my_pools = Mon._select_pools(pool_list, mon_list)
         self.logger.debug("Pools to be scanned on this mon"
                           " : {}".format(','.join(my_pools)))
-        threads = []
 
-        start = time.time()
+        if not self.rbd_scanner:
+            self.rbd_scanner = RBDScanner(self.rados, ttl=self.rbd_scan_ttl)
+            self.rbd_scanner.start()
+
+        self.rbd_scanner.update({pool: pool_objects.get(pool.replace('.', '_'))
+                                 for pool in my_pools})
+
+        counts = self.rbd_scanner.counts()
+        pool_rbds = {}
+        for pool_name, (num_rbds, age) in counts.items():
+            pool_rbds[pool_name.replace('.', '_')] = {
+                "num_rbds": num_rbds,
+                "rbd_scan_age": int(age)}
+
+        pending = [pool_name for pool_name in my_pools
+                   if pool_name not in counts]
+        if pending:
+            # a partial total would under report, so there's no total until
+            # every pool has a count
+            self.logger.debug("total rbds withheld, pools awaiting their "
+                              "first scan : {}".format(','.join(pending)))
+            return None, pool_rbds
+
+        total_rbds = sum([pool_rbds[pool_name]['num_rbds']
+                          for pool_name in pool_rbds])
+        self.logger.debug("total rbds found : {}".format(total_rbds))
 
-        for pool in my_pools:
-            thread = RBDScanner(self.cluster_name, pool)
-            thread.start()
-            threads.append(thread)
+        return total_rbds, pool_rbds
 
-        # wait for all threads to complete
-        for thread in threads:
-            thread.join(1)
+    @staticmethod
+    def is_leader(local_status):
+        """
+        Use the local mon's status to determine whether this mon is the
+        quorum leader. Elections move the leadership, so another mon takes
+        over the cluster collection automatically if the leader fails
+        :param local_status: (dict) mon_status from the mon's admin socket
+        :return: (bool) True if this mon is the leader, or it's state can't
+                 be determined
+        """
 
-        end = time.time()
-        self.logger.debug("rbd scans {:.3f}s".format((end - start)))
+        mon_state = local_status.get('state')
+        if mon_state:
+            return mon_state == 'leader'
+        else:
+            return True
 
-        total_rbds = sum([thread.num_rbds for thread in threads])
-        self.logger.debug("total rbds found : {}".format(total_rbds))
+    def _get_cluster_stats(self, cluster_data):
+        """
+        Query the cluster for the cluster wide metrics
+        :param cluster_data: (dict) cluster section of the mon's perf dump
+        :return: (dict) cluster wide metrics
+        """
 
-        for thread in threads:
-            del thread
+        # The commands are independent, so they're issued together. The osd
+        # dump is large, so it's only requested when the epoch moves
+        osd_epoch = cluster_data.get('osd_epoch')
+        cmd_list = self.health_cmds + ['osd pool stats', 'df']
+        if osd_epoch is None or osd_epoch != self.osd_map['epoch']:
+            cmd_list.append('osd dump')
+        else:
+            self.logger.debug("osd map epoch {} unchanged, using cached "
+                              "osd states".format(osd_epoch))
 
-        return total_rbds
+        responses = self._mon_commands(cmd_list)
+        failed = [cmd for cmd in cmd_list if cmd not in responses]
+
+        if failed:
+            self.error = True
+            msg = 'mon command(s) failed : {}'.format(','.join(failed))
+            self.error_msgs = [msg]
+            self.logger.warning(msg)
+            return {}
+
+        if 'status' in responses:
+            responses.update(Mon._status_responses(responses['status']))
+
+        cluster_state = self.get_mon_health(cluster_data, responses)
+        pool_stats = self._get_pool_stats(responses['osd pool stats'])
+        df_stats = self._get_df_stats(responses['df'])
+        for df_obj in df_stats['pools']:
+            pool_name = df_obj['name']
+            pool_stats[pool_name] = merge_dicts(
+                pool_stats[pool_name], df_obj['stats'])
+        if 'osd dump' in responses:
+            self._update_osd_map(responses['osd dump'])
+
+        cluster_state['num_osd_hosts'] = self.osd_map['num_osd_hosts']
+
+        if self.cluster_stats == 'leader':
+            # no other mon is scanning, so the leader covers all the pools
+            rbd_scanners = {get_hostname(): 0}
+        else:
+            rbd_scanners = cluster_state['mon_status']
+
+        pool_objects = {df_obj['name']: df_obj['stats'].get('objects')
+                        for df_obj in df_stats['pools']}
+        num_rbds, pool_rbds = self._get_rbds(rbd_scanners, pool_objects,
+                                             osd_epoch)
+        if num_rbds is not None:
+            cluster_state['num_rbds'] = num_rbds
+        for pool_name in pool_rbds:
+            pool_stats[pool_name] = merge_dicts(pool_stats.get(pool_name, {}),
+                                                pool_rbds[pool_name])
+
+        osd_states = self.osd_map['osd_states']
+
+        return merge_dicts(cluster_state, {"pools": pool_stats,
+                                           "osd_state": osd_states})
+
+    @staticmethod
+    def _local_stats(local_status):
+        """
+        Summarize this mon's own state from it's mon_status
+        :param local_status: (dict) mon_status from the mon's admin socket
+        :return: (dict) local mon metrics, empty if the status is unavailable
+        """
+
+        if 'state' not in local_status:
+            return {}
+
+        rank = local_status.get('rank', -1)
+        return {
+            "state": Mon.local_states.get(local_status['state'],
+                                          len(Mon.local_states)),
+            "rank": rank,
+            "in_quorum": int(rank in local_status.get('quorum', []))
+        }
 
     def get_stats(self):
         """
@@ -588,35 +1072,40 @@ class Mon(BaseCollector):
 
         start = time.time()
 
-        # Attempt to read the admin socket for cluster data
-        cluster_data = self.get_cluster_state()
+        local_status = self._admin_socket(cmds=['mon_status'])
 
-        if cluster_data:
-
-            # read from the admin socket was OK, so process the data
-            cluster_state = self.get_mon_health(cluster_data)
-            pool_stats = self._get_pool_stats()
-            df_stats = self._get_df_stats()
-            for df_obj in df_stats['pools']:
-                pool_name = df_obj['name']
-                pool_stats[pool_name] = merge_dicts(
-                    pool_stats[pool_name], df_obj['stats'])
-            num_osd_hosts, osd_states = self._get_osd_states()
+        if (self.cluster_stats == 'leader' and
+                not self.is_leader(local_status)):
+            # the quorum leader provides the cluster wide metrics
+            self.logger.debug("not the quorum leader, cluster stats "
+                              "skipped")
+            all_stats = {}
 
-            cluster_state['num_osd_hosts'] = num_osd_hosts
-            cluster_state['num_rbds'] = self._get_rbds(cluster_state['mon_status'])
+            if self.rbd_scanner:
+                # pool scanning is handed over to the leader
+                self.rbd_scanner.update({})
 
-            all_stats = merge_dicts(cluster_state, {"pools": pool_stats,
-                                                    "osd_state": osd_states})
         else:
-            # problem reading from the admin socket, record it in cephmetrics
-            # log and set the object's error flag so it can be picked up at the
-            # layer above the Mon instance (Ceph instance -> collectd log)
-            all_stats = {}
-            self.error = True
-            msg = 'MON socket is not available...is ceph-mon active?'
-            self.error_msgs = [msg]
-            self.logger.warning(msg)
+            # Attempt to read the admin socket for cluster data
+            cluster_data = self.get_cluster_state()
+
+            if cluster_data:
+                # read from the admin socket was OK, so query the cluster
+                all_stats = self._get_cluster_stats(cluster_data)
+            else:
+                # problem reading from the admin socket, record it in
+                # cephmetrics log and set the object's error flag so it can be
+                # picked up at the layer above the Mon instance (Ceph
+                # instance -> collectd log)
+                all_stats = {}
+                self.error = True
+                msg = 'MON socket is not available...is ceph-mon active?'
+                self.error_msgs = [msg]
+                self.logger.warning(msg)
+
+        local_stats = Mon._local_stats(local_status)
+        if local_stats:
+            all_stats['local'] = local_stats
 
         all_stats['ceph_version'] = self.version
 
@@ -626,4 +1115,3 @@ class Mon(BaseCollector):
         return {
             "mon": all_stats
         }
-
@@ -1,12 +1,114 @@
 #!/usr/bin/env python
 
 import os
+import re
 import time
 import math
+import select
+import threading
+from array import array
 
 from collectors.base import BaseCollector
-from collectors.common import (todict, fread, freadlines, merge_dicts,
-                               IOstat, Disk)
+from collectors.common import (fread, merge_dicts, record_dumper,
+                               concurrent_map, get_slaves, is_dm_crypt,
+                               IOstat, DiskStats, DiskStatsReader,
+                               DiskSampler, Disk)
+
+
+# perf counter type bits (ceph's perf_counter_type_d)
+PERFCOUNTER_TIME = 0x1
+PERFCOUNTER_U64 = 0x2
+PERFCOUNTER_LONGRUNAVG = 0x4
+PERFCOUNTER_COUNTER = 0x8
+PERFCOUNTER_HISTOGRAM = 0x10
+
+
+class LatencyHistogram(object):
+    """
+    Tracks a perf histogram counter collapsed onto it's first (latency)
+    axis, so the distribution of each interval can be reported as
+    percentiles. The bucket counts are held in fixed size arrays that are
+    reused every interval
+    """
+
+    percentiles = (50, 95, 99)
+
+    def __init__(self, axis):
+        self.edges = LatencyHistogram.axis_edges(axis)
+        self.size = len(self.edges)
+        self._current = array('d', [0]) * self.size
+        self._previous = array('d', [0]) * self.size
+        self.delta = array('d', [0]) * self.size
+        self.valid = False      # True once delta holds an interval's counts
+        self._samples = 0
+
+    @staticmethod
+    def axis_edges(axis):
+        """
+        :param axis: (dict) histogram axis from a perf histogram dump
+        :return: (array) value each bucket represents - it's upper bound,
+                 or it's lower bound for the overflow bucket (no max)
+        """
+
+        edges = [bucket.get('max', bucket.get('min', 0))
+                 for bucket in axis.get('ranges', [])]
+        return array('d', [max(edge, 0) for edge in edges])
+
+    def invalidate(self):
+        """ forget the samples taken, e.g. when the counter disappears """
+        self.valid = False
+        self._samples = 0
+
+    def update(self, values):
+        """
+        take a new sample of the histogram
+        :param values: (list) cumulative counts as a list of rows, one row
+                       per latency bucket
+        """
+
+        if len(values) != self.size:
+            self.invalidate()
+            return
+
+        self._previous, self._current = self._current, self._previous
+        current = self._current
+        for ptr, row in enumerate(values):
+            current[ptr] = sum(row) if isinstance(row, list) else row
+        self._samples += 1
+
+        if self._samples > 1:
+            previous = self._previous
+            delta = self.delta
+            for ptr in range(self.size):
+                delta[ptr] = current[ptr] - previous[ptr]
+
+            # counts only go backwards when the daemon restarts
+            self.valid = min(delta) >= 0
+
+    @staticmethod
+    def get_percentiles(counts, edges):
+        """
+        :param counts: (array) bucket counts for an interval
+        :param edges: (array) value each bucket represents
+        :return: (dict) percentile -> value, empty for an interval with no
+                 counts since there's no latency to report
+        """
+
+        total = sum(counts)
+        results = {}
+        if not total:
+            return results
+
+        cumulative = 0
+        ptr = 0
+        for pct in LatencyHistogram.percentiles:
+            target = total * pct / 100.0
+            while ptr < len(counts) - 1 and cumulative + counts[ptr] < target:
+                cumulative += counts[ptr]
+                ptr += 1
+            results[pct] = edges[ptr]
+
+        return results
 
 
 class OSDstats(object):
@@ -17,6 +119,7 @@ class OSDstats(object):
         "stat_bytes_avail": ("stat_bytes_avail", "gauge")
     }
 
+    # counters collected when no OSDCounters are configured
     perf_metrics = {
         "filestore": {
             "journal_latency",
@@ -33,50 +136,87 @@ class OSDstats(object):
         }
     }
 
+    fields = ("osd_type", "osd_percent_used") + tuple(sorted(osd_capacity))
+
+    # the perf counters are configurable, so they're held in a dict
+    __slots__ = ("_current", "_previous", "_osd_type", "_version",
+                 "_socket_id", "_histograms", "counters") + fields
+
     def __init__(self, osd_type='filestore'):
         self._current = {}
         self._previous = {}
         self._osd_type = osd_type
+        self._version = None
+        self._socket_id = None
+        self._histograms = {}   # metric name -> LatencyHistogram
+        self.counters = {}      # metric name -> value for the interval
         self.osd_type = Disk.osd_types[osd_type]
         self.osd_percent_used = 0
+        for attr in OSDstats.osd_capacity:
+            setattr(self, attr, None)
+
+    _dump_fields = record_dumper(fields)
 
-    def update(self, stats):
+    def dump(self):
+        data = self._dump_fields()
+        data.update(self.counters)
+        return data
+
+    def update(self, stats, counter_spec):
         """
         update the objects attributes based on the 'stats' dict
-        :param stats: (dict) containing performance ('filestore' or 'bluestore')
-               and capacity info ('osd')
+        :param stats: (dict) containing the perf counters by logger
+               ('counters') and capacity info ('osd')
+        :param counter_spec: (dict) logger -> {counter name: (metric name,
+               counter type)} for the counters to report
         :return: None
         """
 
-        if self._current:
-            self._previous = self._current
-            self._current = stats[self._osd_type]
-        else:
-            self._current = stats[self._osd_type]
+        self._previous = self._current
+        self._current = stats['counters']
 
-        for attr in OSDstats.perf_metrics[self._osd_type]:
+        # rebuilt each interval, so counters no longer in the dump or the
+        # spec stop being reported
+        self.counters = {}
 
-            if attr not in self._current:
-                # skip if the attribute needed isn't available
-                # eg. early versions of bluestore didn't have a 'stable'
-                # set of perf counters
-                continue
+        for logger in counter_spec:
+            current = self._current.get(logger, {})
+            previous = self._previous.get(logger, {})
+
+            for attr, (name, counter_type) in counter_spec[logger].items():
 
-            if self._previous:
-                d_sum = self._current[attr].get('sum') - \
-                        self._previous[attr].get('sum')
-                d_avgcount = self._current[attr].get('avgcount') - \
-                             self._previous[attr].get('avgcount')
+                if counter_type & PERFCOUNTER_HISTOGRAM:
+                    self._update_histogram(
+                        name, stats['histograms'].get(logger, {}).get(attr))
+                    continue
 
-                if d_sum == 0 or d_avgcount == 0:
-                    val = 0
+                if attr not in current:
+                    # skip if the attribute needed isn't available
+                    # eg. early versions of bluestore didn't have a 'stable'
+                    # set of perf counters
+                    continue
+
+                if counter_type & PERFCOUNTER_LONGRUNAVG:
+                    # report the average for this interval
+                    if attr in previous:
+                        d_sum = current[attr].get('sum') - \
+                                previous[attr].get('sum')
+                        d_avgcount = current[attr].get('avgcount') - \
+                            previous[attr].get('avgcount')
+
+                        if d_sum == 0 or d_avgcount == 0:
+                            val = 0
+                        else:
+                            val = float(d_sum) / d_avgcount
+                    else:
+                        # no previous value, so set to 0
+                        val = 0
                 else:
-                    val = float(d_sum) / d_avgcount
-            else:
-                # no previous value, so set to 0
-                val = 0
+                    # gauges are reported as is, and counters are left to
+                    # collectd to derive the rate
+                    val = current[attr]
 
-            setattr(self, attr, val)
+                self.counters[name] = val
 
         for attr in stats['osd']:
             setattr(self, attr, stats['osd'].get(attr))
@@ -84,21 +224,120 @@ class OSDstats(object):
         self.osd_percent_used = math.ceil((float(self.stat_bytes_used) /
                                            self.stat_bytes) * 100)
 
+    @staticmethod
+    def histogram_name(counter, pct):
+        # e.g. op_r_latency_out_bytes_histogram -> op_r_latency_out_bytes_p99
+        if counter.endswith('_histogram'):
+            counter = counter[:-len('_histogram')]
+        return '{}_p{}'.format(counter, pct)
+
+    def _update_histogram(self, counter, data):
+        """
+        sample a histogram counter, and set the percentile attributes for
+        the last interval
+        :param counter: (str) histogram counter name
+        :param data: (dict) the counter's axes and values from a perf
+                     histogram dump
+        """
+
+        histogram = self._histograms.get(counter)
+        pct_values = {}
+
+        if data and data.get('axes'):
+            axis = data['axes'][0]
+            if (histogram is None or
+                    histogram.edges != LatencyHistogram.axis_edges(axis)):
+                # new counter, or the bucket layout has changed
+                histogram = LatencyHistogram(axis)
+                self._histograms[counter] = histogram
+
+            histogram.update(data.get('values', []))
+
+            if histogram.valid:
+                pct_values = LatencyHistogram.get_percentiles(
+                    histogram.delta, histogram.edges)
+
+        elif histogram is not None:
+            histogram.invalidate()
+
+        # without an interval's counts (first sample, daemon restart, layout
+        # change) the percentiles are left out rather than reported as 0
+        for pct in LatencyHistogram.percentiles:
+            name = OSDstats.histogram_name(counter, pct)
+            if pct in pct_values:
+                self.counters[name] = pct_values[pct]
+            else:
+                self.counters.pop(name, None)
+
 
 class OSDs(BaseCollector):
 
     all_metrics = merge_dicts(Disk.metrics, IOstat.metrics)
     supported_object_stores = ['filestore', 'bluestore']
 
+    # perf dumps are fetched in parallel, and any OSD that hasn't responded
+    # within the timeout (secs) is skipped for this interval
+    max_workers = 8
+    perf_dump_timeout = 5
+
+    mounts_file = '/proc/self/mounts'
+    socket_dir = '/var/run/ceph'
+    data_dir = '/var/lib/ceph'
+
     def __init__(self, *args, **kwargs):
         BaseCollector.__init__(self, *args, **kwargs)
-        self.timestamp = int(time.time())
 
         self.osd = {}		# dict of disk objects, each disk contains osd_id
         self.jrnl = {}      # dict of journal devices (if not collocated)
         self.osd_id_list = []
         self.dev_lookup = {}    # dict dev_name -> osd | jrnl
+        self.osd_devices = {}   # osd_id -> {data|db|wal: [dev_name]}
         self.osd_count = 0
+        self.disk_stats = DiskStats()   # iostats of the osd & jrnl devices
+        self.diskstats_reader = DiskStatsReader(self.disk_stats)
+
+        # the osd layout is only rescanned when the mount table or the set
+        # of osd admin sockets changes
+        self._mounts = None         # open mounts file, polled for changes
+        self._mounts_poll = None
+        self._sockets = None        # osd_id -> admin socket, at last scan
+        self._rescan = False        # last scan was incomplete, so retry it
+
+        # perf counters to collect, as regex patterns of logger.counter
+        counters = None
+        if self._parent:
+            counters = self._parent.osd_counters
+        if not counters:
+            counters = ['{}.{}'.format(logger, counter)
+                        for logger in OSDstats.perf_metrics
+                        for counter in OSDstats.perf_metrics[logger]]
+        self.counter_patterns = [re.compile('{}$'.format(pattern))
+                                 for pattern in counters]
+
+        # latency histograms to report as percentiles, none by default
+        histograms = []
+        if self._parent:
+            histograms = self._parent.osd_histograms or []
+        self.histogram_patterns = [re.compile('{}$'.format(pattern))
+                                   for pattern in histograms]
+
+        # counter name -> [edges, counts] summed across the host's osds
+        self.host_histograms = {}
+
+        # (version, osd type) -> {logger: {counter: (metric name, type)}},
+        # from perf schema
+        self.counter_specs = {}
+        self._schema_lock = threading.Lock()
+        self.all_metrics = OSDs.all_metrics
+
+        # optional sub-interval sampling of the osd and journal devices
+        self.disk_sampler = None
+        self.disk_sampler_busy = 0
+        if self._parent and self._parent.osd_sample_rate:
+            self.disk_sampler = DiskSampler(rate=self._parent.osd_sample_rate)
+            self.disk_sampler.start()
+            self.all_metrics = merge_dicts(self.all_metrics,
+                                           DiskSampler.metrics)
 
     def __repr__(self):
 
@@ -107,18 +346,154 @@ class OSDs(BaseCollector):
             s += "{}\n".format(disk)
             dev = self.osd[disk]
 
-            for var in vars(dev):
-                if not var.startswith('_'):
-                    s += "{} ... {}\n".format(var, getattr(dev, var))
+            for var, value in sorted(dev.dump().items()):
+                s += "{} ... {}\n".format(var, value)
         return s
 
+    def _select_counters(self, schema):
+        """
+        pick out the perf counters that match the configured patterns. A
+        counter is reported by it's name, unless the same name is selected
+        from more than one logger e.g. throttle-*.get, when it's qualified by
+        the logger as <logger>_<counter>
+        :param schema: (dict) output of perf schema
+        :return: (dict) logger -> {counter name: (metric name, counter type)}
+        """
+
+        selected = []
+        for logger in schema:
+            for counter, desc in schema[logger].items():
+                counter_type = desc.get('type', 0)
+                name = '{}.{}'.format(logger, counter)
+
+                # histograms aren't simple values, so are only collected
+                # when asked for explicitly
+                if counter_type & PERFCOUNTER_HISTOGRAM:
+                    patterns = self.histogram_patterns
+                else:
+                    patterns = self.counter_patterns
+
+                if any(pattern.match(name) for pattern in patterns):
+                    # the names become metric names, so are kept as str
+                    selected.append((str(logger), str(counter), counter_type))
+
+        loggers = {}
+        for logger, counter, _counter_type in selected:
+            loggers.setdefault(counter, []).append(logger)
+
+        counter_spec = {}
+        for logger, counter, counter_type in selected:
+            if len(loggers[counter]) > 1:
+                name = '{}_{}'.format(logger, counter)
+            else:
+                name = counter
+            counter_spec.setdefault(logger, {})[counter] = (name, counter_type)
+
+        return counter_spec
+
+    def _add_metrics(self, counter_spec):
+        """
+        add the collectd data types of the selected counters to the metrics
+        definitions used when the stats are dispatched
+        :param counter_spec: (dict) logger -> {counter name: (metric name,
+               counter type)}
+        """
+
+        metrics = {}
+        for logger in counter_spec:
+            for name, counter_type in counter_spec[logger].values():
+                if counter_type & PERFCOUNTER_HISTOGRAM:
+                    for pct in LatencyHistogram.percentiles:
+                        pct_name = OSDstats.histogram_name(name, pct)
+                        metrics[pct_name] = (pct_name, "gauge")
+                elif (counter_type & PERFCOUNTER_COUNTER and
+                        not counter_type & PERFCOUNTER_LONGRUNAVG):
+                    metrics[name] = (name, "derive")
+                else:
+                    metrics[name] = (name, "gauge")
+
+        self.all_metrics = merge_dicts(self.all_metrics, metrics)
+
+    def _get_counter_spec(self, osd_id, socket_path):
+        """
+        Determine the perf counters to collect from an osd. The perf schema
+        is read once for each osd version and object store type, and the
+        daemon's version is checked again whenever it's admin socket is
+        recreated (i.e. the daemon has restarted)
+        :param osd_id: (str) osd id
+        :param socket_path: (str) osd's admin socket
+        :return: (dict) logger -> {counter name: (metric name, counter
+                 type)}, or None if the osd didn't respond
+        """
+
+        osd = self.osd[osd_id]
+
+        sock_stat = os.stat(socket_path)
+        socket_id = (sock_stat.st_ino, sock_stat.st_mtime)
+        if socket_id != osd._socket_id:
+            version = self._admin_socket(cmds=['version'],
+                                         socket_path=socket_path)
+            if not version:
+                return None
+            osd._version = version.get('version')
+            osd._socket_id = socket_id
+
+        spec_key = (osd._version, osd._osd_type)
+
+        with self._schema_lock:
+            if spec_key not in self.counter_specs:
+                schema = self._admin_socket(cmds=['perf', 'schema'],
+                                            socket_path=socket_path)
+                if not schema:
+                    return None
+
+                counter_spec = self._select_counters(schema)
+                self.counter_specs[spec_key] = counter_spec
+                self._add_metrics(counter_spec)
+
+                self.logger.info("perf counters for osd version {} ({}) : "
+                                 "{}".format(osd._version, osd._osd_type,
+                                             counter_spec))
+
+        return self.counter_specs[spec_key]
+
+    def _socket_path(self, osd_id):
+        if self._sockets and osd_id in self._sockets:
+            return self._sockets[osd_id]
+        return os.path.join(OSDs.socket_dir,
+                            '{}-osd.{}.asok'.format(self.cluster_name, osd_id))
+
+    def _fetch_loggers(self, socket_path, cmds, loggers):
+        """
+        Issue a perf command for each logger. Daemons that don't support the
+        logger argument reply with every logger, so that one reply is used
+        for all of them
+        :param socket_path: (str) osd admin socket
+        :param cmds: (list) command words e.g. perf dump
+        :param loggers: (list) loggers needed from the response
+        :return: (dict) response sections by logger
+        """
+
+        resp = {}
+        for logger in sorted(loggers):
+            if logger in resp:
+                continue
+
+            reply = self._admin_socket(cmds=cmds, socket_path=socket_path,
+                                       logger=logger)
+            resp.update(reply)
+            if any(section != logger for section in reply):
+                # the logger was ignored, so there's nothing more to fetch
+                break
+
+        return resp
+
     def _fetch_osd_stats(self, osd_id, osd_type='filestore'):
 
         # NB: osd stats are cumulative
 
         stats = {}
-        osd_socket_name = '/var/run/ceph/{}-osd.{}.asok'.format(self.cluster_name,
-                                                                osd_id)
+        osd_socket_name = self._socket_path(osd_id)
 
         if not os.path.exists(osd_socket_name):
             # all OSD's should expose an admin socket, so if it's missing
@@ -130,12 +505,43 @@ class OSDs(BaseCollector):
             return
 
         self.logger.debug("fetching osd stats for osd {}".format(osd_id))
-        resp = self._admin_socket(socket_path=osd_socket_name)
 
-        perf_stats = resp.get(osd_type)
+        counter_spec = self._get_counter_spec(osd_id, osd_socket_name)
+        if counter_spec is None:
+            return
+
+        # only the loggers holding the selected counters and the osd
+        # capacity are needed from the perf dump, so ask for them by logger
+        # rather than pulling the whole dump
+        dump_loggers = []
+        histogram_loggers = []
+        for logger in set(counter_spec).union(['osd']):
+            counter_types = [counter_type for _name, counter_type
+                             in counter_spec.get(logger, {}).values()]
+            if any(counter_type & PERFCOUNTER_HISTOGRAM
+                   for counter_type in counter_types):
+                histogram_loggers.append(logger)
+
+            if logger == 'osd' or not all(
+                    counter_type & PERFCOUNTER_HISTOGRAM
+                    for counter_type in counter_types):
+                dump_loggers.append(logger)
+
+        resp = self._fetch_loggers(osd_socket_name, ['perf', 'dump'],
+                                   dump_loggers)
+        histograms = self._fetch_loggers(osd_socket_name,
+                                         ['perf', 'histogram', 'dump'],
+                                         histogram_loggers)
+
+        if 'osd' not in resp:
+            return
 
-        stats[osd_type] = {key_name: perf_stats.get(key_name)
-                           for key_name in OSDstats.perf_metrics[osd_type]}
+        stats['histograms'] = histograms
+
+        stats['counters'] = {logger: {key_name: resp[logger].get(key_name)
+                                      for key_name in counter_spec[logger]
+                                      if key_name in resp[logger]}
+                             for logger in counter_spec if logger in resp}
 
         osd_stats = resp.get('osd')
 
@@ -143,7 +549,7 @@ class OSDs(BaseCollector):
         stats['osd'] = {key_name: osd_stats.get(key_name)
                         for key_name in OSDstats.osd_capacity.keys()}
 
-        return stats
+        return stats, counter_spec
 
     @staticmethod
     def get_osd_type(osd_path):
@@ -157,19 +563,107 @@ class OSDs(BaseCollector):
             else:
                 raise ValueError("Unrecognised OSD type")
 
-    def _dev_to_osd(self):
+    def _get_sockets(self):
         """
-        Look at the system to determine which disks are acting as OSD's
+        Find the admin sockets of the osds on the host. Sockets of
+        containerized osds are held in a directory per cluster fsid
+        :return: (dict) osd id -> admin socket path
+        """
+
+        prefix = '{}-osd.'.format(self.cluster_name)
+        sockets = {}
+
+        try:
+            entries = os.listdir(OSDs.socket_dir)
+        except OSError:
+            return sockets
+
+        socket_dirs = [OSDs.socket_dir]
+        socket_dirs.extend(os.path.join(OSDs.socket_dir, entry)
+                           for entry in entries
+                           if os.path.isdir(os.path.join(OSDs.socket_dir,
+                                                         entry)))
+
+        for socket_dir in socket_dirs:
+            if socket_dir == OSDs.socket_dir:
+                fnames = entries
+            else:
+                try:
+                    fnames = os.listdir(socket_dir)
+                except OSError:
+                    continue
+
+            for fname in fnames:
+                if fname.startswith(prefix) and fname.endswith('.asok'):
+                    osd_id = fname[len(prefix):-len('.asok')]
+                    sockets[osd_id] = os.path.join(socket_dir, fname)
+
+        return sockets
+
+    def _layout_changed(self):
+        """
+        Check whether the osds on the host may have changed since the last
+        scan. The kernel flags the mounts file with POLLPRI whenever the
+        mount table changes, and an osd starting or stopping creates or
+        removes it's admin socket
+        :return: (bool) True if the osds need to be rescanned
+        """
+
+        # the change that triggered an incomplete scan has been consumed, so
+        # the scan is retried until it completes
+        changed = self._rescan
+
+        if self._mounts_poll is None:
+            self._mounts = open(OSDs.mounts_file)
+            self._mounts_poll = select.poll()
+            self._mounts_poll.register(self._mounts,
+                                       select.POLLPRI | select.POLLERR)
+            changed = True
+        elif self._mounts_poll.poll(0):
+            changed = True
+
+        sockets = self._get_sockets()
+        if sockets != self._sockets:
+            self._sockets = sockets
+            changed = True
+
+        return changed
+
+    def _read_mounts(self):
+        self._mounts.seek(0)
+        return self._mounts.read().splitlines()
+
+    @staticmethod
+    def get_devices(dev_path):
+        """
+        Resolve a device path or symlink (e.g. an osd's block link) to the
+        physical devices holding it
+        :param dev_path: (str) device path
+        :return: (tuple) list of kernel device names, and 1 if the device is
+                 encrypted or 0 if not
+        """
+
+        if not os.path.exists(dev_path):
+            return [], 0
+
+        dev_name = os.path.realpath(dev_path).split('/')[-1]
+        return get_slaves(dev_name), int(is_dm_crypt(dev_name))
+
+    def _find_osds(self):
+        """
+        Find the osds on the host, from the osd mount points and the admin
+        sockets of osds that aren't mounted on the host (containers)
+        :return: (dict) osd id -> (osd data path, mounted device or None)
         """
 
         # the logic here uses the mount points to determine which OSD's are
-        # in the system. The encryption state is determine just by the use
-        # devicemapper (i.e. /dev/mapper prefixed devices) - since at this time
-        # this is all dm is used for.
+        # in the system. ceph-disk and ceph-volume osds are mounted under
+        # /var/lib (ceph-volume bluestore osds on a tmpfs)
 
         osd_indicators = {'var', 'lib', 'osd'}
+        osds = {}
 
-        for mnt in freadlines('/proc/mounts'):
+        for mnt in self._read_mounts():
             items = mnt.split(' ')
             dev_path, path_name = items[:2]
             if path_name.startswith('/var/lib'):
@@ -185,69 +679,157 @@ class OSDs(BaseCollector):
                     if not osd_id.isdigit():
                         osd_id = fread(os.path.join(path_name, 'whoami'))
 
-                    if osd_id not in self.osd:
-                        osd_type = OSDs.get_osd_type(path_name)
-                        self.osd[osd_id] = OSDstats(osd_type=osd_type)
-                        self.osd_id_list.append(osd_id)
-
-                        osd_type = self.osd[osd_id]._osd_type
-                        if osd_type == 'filestore':
-                            if dev_path.startswith('/dev/mapper'):
-                                encrypted = 1
-                                uuid = dev_path.split('/')[-1]
-                                partuuid = '/dev/disk/by-partuuid/{}'.format(uuid)
-                                dev_path = os.path.realpath(partuuid)
-                                osd_device = dev_path.split('/')[-1]
-                            else:
-                                encrypted = 0
-                                osd_device = dev_path.split('/')[-1]
-
-                        elif osd_type == 'bluestore':
-                            block_link = os.path.join(path_name, 'block')
-                            osd_path = os.path.realpath(block_link)
-                            osd_device = osd_path.split('/')[-1]
-                            encrypted = 0
-                        else:
-                            raise ValueError("Unknown OSD type encountered")
-
-                        # if the osd_id hasn't been seem neither has the
-                        # disk
-                        self.osd[osd_device] = Disk(osd_device,
-                                                    path_name=path_name,
-                                                    osd_id=osd_id,
-                                                    in_osd_type=osd_type,
-                                                    encrypted=encrypted)
-                        self.dev_lookup[osd_device] = 'osd'
-                        self.osd_count += 1
-
-                        if osd_type == 'filestore':
-                            journal_link = os.path.join(path_name, 'journal')
-                        else:
-                            journal_link = os.path.join(path_name, 'block.wal')
+                    osds[osd_id] = (path_name, dev_path)
 
-                        if os.path.exists(journal_link):
-                            link_tgt = os.readlink(journal_link)
-                            if link_tgt.startswith('/dev/mapper'):
-                                encrypted = 1
-                            else:
-                                encrypted = 0
+        # containerized osds keep their data dir on the host under the
+        # cluster's fsid, alongside their admin socket's directory
+        for osd_id, socket_path in self._sockets.items():
+            if osd_id in osds:
+                continue
 
-                            partuuid_path = os.path.join('/dev/disk/by-partuuid',
-                                                         link_tgt.split('/')[-1])
-                            jrnl_path = os.path.realpath(partuuid_path)
-                            jrnl_dev = jrnl_path.split('/')[-1]
+            candidates = []
+            socket_dir = os.path.dirname(socket_path)
+            if socket_dir != OSDs.socket_dir:
+                candidates.append(os.path.join(OSDs.data_dir,
+                                               os.path.basename(socket_dir),
+                                               'osd.{}'.format(osd_id)))
+            candidates.append(os.path.join(OSDs.data_dir, 'osd',
+                                           '{}-{}'.format(self.cluster_name,
+                                                          osd_id)))
 
-                            if jrnl_dev not in self.osd:
-                                self.jrnl[jrnl_dev] = Disk(jrnl_dev,
-                                                           osd_id=osd_id,
-                                                           in_osd_type=osd_type,
-                                                           encrypted=encrypted)
+            for path_name in candidates:
+                if os.path.isdir(path_name):
+                    osds[osd_id] = (path_name, None)
+                    break
 
-                                self.dev_lookup[jrnl_dev] = 'jrnl'
+        return osds
 
-                        else:
-                            # No journal or WAL link..?
-                            pass
+    def _add_osd(self, osd_id, path_name, dev_path=None):
+        """
+        Add an osd, and the physical devices it's data, db and wal/journal
+        are held on
+        :param osd_id: (str) osd id
+        :param path_name: (str) osd data directory
+        :param dev_path: (str) device mounted on the data directory
+        """
+
+        osd_type = OSDs.get_osd_type(path_name)
+        if osd_type == 'filestore':
+            if dev_path is None:
+                self.logger.warning("data device for osd.{} not "
+                                    "found".format(osd_id))
+                return
+            data_link = dev_path
+            devices = {'wal': OSDs.get_devices(
+                os.path.join(path_name, 'journal'))}
+        elif osd_type == 'bluestore':
+            data_link = os.path.join(path_name, 'block')
+            devices = {'db': OSDs.get_devices(
+                           os.path.join(path_name, 'block.db')),
+                       'wal': OSDs.get_devices(
+                           os.path.join(path_name, 'block.wal'))}
+        else:
+            raise ValueError("Unknown OSD type encountered")
+
+        devices['data'] = OSDs.get_devices(data_link)
+
+        self.osd[osd_id] = OSDstats(osd_type=osd_type)
+        self.osd_id_list.append(osd_id)
+        self.osd_count += 1
+
+        # devices shared by several osds (e.g. a db device) are tracked
+        # once, against the first osd seen on them
+        for role in ('data', 'db', 'wal'):
+            dev_names, encrypted = devices.get(role, ([], 0))
+            for dev_name in dev_names:
+                if dev_name in self.dev_lookup:
+                    continue
+
+                if role == 'data':
+                    self.osd[dev_name] = Disk(dev_name,
+                                              path_name=path_name,
+                                              osd_id=osd_id,
+                                              in_osd_type=osd_type,
+                                              encrypted=encrypted)
+                    self.dev_lookup[dev_name] = 'osd'
+                    self._track_device(dev_name, self.osd[dev_name])
+                else:
+                    self.jrnl[dev_name] = Disk(dev_name,
+                                               osd_id=osd_id,
+                                               in_osd_type=osd_type,
+                                               encrypted=encrypted)
+                    self.dev_lookup[dev_name] = 'jrnl'
+                    self._track_device(dev_name, self.jrnl[dev_name])
+
+        self.osd_devices[osd_id] = {role: devices[role][0]
+                                    for role in devices}
+        self.logger.info("osd.{} added, devices : "
+                         "{}".format(osd_id, self.osd_devices[osd_id]))
+
+    def _track_device(self, dev_name, disk):
+        self.disk_stats.add(dev_name, disk.perf)
+        if self.disk_sampler:
+            self.disk_sampler.add(dev_name, disk.perf)
+
+    def _remove_osd(self, osd_id):
+        """
+        Forget an osd that's no longer on the host, along with the devices
+        no other osd uses
+        :param osd_id: (str) osd id
+        """
+
+        self.logger.info("osd.{} removed".format(osd_id))
+
+        del self.osd[osd_id]
+        self.osd_id_list.remove(osd_id)
+        self.osd_count -= 1
+
+        devices = self.osd_devices.pop(osd_id, {})
+        in_use = set(dev_name for osd_devices in self.osd_devices.values()
+                     for dev_names in osd_devices.values()
+                     for dev_name in dev_names)
+        for dev_names in devices.values():
+            for dev_name in dev_names:
+                if dev_name in in_use:
+                    continue
+                self.disk_stats.remove(dev_name)
+                if self.disk_sampler:
+                    self.disk_sampler.remove(dev_name)
+                if self.dev_lookup.pop(dev_name, None) == 'jrnl':
+                    self.jrnl.pop(dev_name, None)
+                else:
+                    self.osd.pop(dev_name, None)
+
+        socket_name = '{}-osd.{}.asok'.format(self.cluster_name, osd_id)
+        for socket_path in [socket_path for socket_path in self._asok_clients
+                            if os.path.basename(socket_path) == socket_name]:
+            self._asok_clients.pop(socket_path).close()
+
+    def _dev_to_osd(self):
+        """
+        Look at the system to determine which disks are acting as OSD's
+        :return: (bool) True if every osd found was added
+        """
+
+        osds = self._find_osds()
+        complete = True
+
+        for osd_id in osds:
+            if osd_id not in self.osd:
+                path_name, dev_path = osds[osd_id]
+                try:
+                    self._add_osd(osd_id, path_name, dev_path)
+                except (ValueError, IOError, OSError) as e:
+                    # e.g. a ceph-volume tmpfs mounted before it's type file
+                    # is written, so the osd is picked up on a later scan
+                    self.logger.warning("osd.{} not added, retrying next "
+                                        "interval - {}".format(osd_id, e))
+                    complete = False
+
+        for osd_id in set(self.osd_id_list) - set(osds):
+            self._remove_osd(osd_id)
+
+        return complete
 
     def _stats_lookup(self):
         """
@@ -256,31 +838,18 @@ class OSDs(BaseCollector):
         """
 
         now = time.time()
-        interval = int(now) - self.timestamp
-        self.timestamp = int(now)
-
-        # Fetch diskstats from the OS
-        for perf_entry in freadlines('/proc/diskstats'):
 
-            field = perf_entry.split()
-            dev_name = field[2]
+        # Fetch diskstats from the OS, and calculate the iostats of all the
+        # osd and journal devices in one pass. Rates are over the exact
+        # (monotonic) time between each device's samples
+        self.disk_stats.begin()
+        self.diskstats_reader.read()
+        self.disk_stats.compute()
 
-            device = None
-            if self.dev_lookup.get(dev_name, None) == 'osd':
-                device = self.osd[dev_name]
-            elif self.dev_lookup.get(dev_name, None) == 'jrnl':
-                device = self.jrnl[dev_name]
-
-            if device:
-                new_stats = field[3:]
-
-                if device.perf._current:
-                    device.perf._previous = device.perf._current
-                    device.perf._current = new_stats
-                else:
-                    device.perf._current = new_stats
-                
-                device.perf.compute(interval)
+        if self.disk_sampler:
+            self.disk_sampler_busy = self.disk_sampler.drain()
+            self.logger.debug("disk sampler busy for {:.3f}% of the "
+                              "interval".format(self.disk_sampler_busy))
 
         end = time.time()
         self.logger.debug("OS disk stats calculated in "
@@ -288,29 +857,88 @@ class OSDs(BaseCollector):
 
         # fetch stats from each osd daemon
         osd_stats_start = time.time()
+        osd_ids = []
         for osd_id in self.osd_id_list:
 
             osd_type = self.osd[osd_id]._osd_type
 
             if osd_type in OSDs.supported_object_stores:
-
-                osd_stats = self._fetch_osd_stats(osd_id, osd_type)
-                if osd_stats:
-                    osd_device = self.osd[osd_id]
-                    osd_device.update(osd_stats)
-                else:
-                    self.logger.warning("OSD stats for osd.{} not "
-                                        "available".format(osd_id))
-
+                osd_ids.append(osd_id)
             else:
                 self.logger.warning("Unknown OSD type encountered for "
                                     "osd.{}".format(osd_id))
 
+        all_osd_stats = concurrent_map(
+            lambda osd_id: self._fetch_osd_stats(osd_id,
+                                                 self.osd[osd_id]._osd_type),
+            osd_ids,
+            max_workers=OSDs.max_workers,
+            timeout=OSDs.perf_dump_timeout)
+
+        for osd_id in osd_ids:
+            if all_osd_stats.get(osd_id):
+                osd_stats, counter_spec = all_osd_stats[osd_id]
+                osd_device = self.osd[osd_id]
+                osd_device.update(osd_stats, counter_spec)
+            else:
+                self.logger.warning("OSD stats for osd.{} not "
+                                    "available".format(osd_id))
+
+        if self.histogram_patterns:
+            self._rollup_histograms(
+                [osd_id for osd_id in osd_ids if all_osd_stats.get(osd_id)])
+
         osd_stats_end = time.time()
         self.logger.debug("OSD perf dump stats collected for {} OSDs "
                           "in {:.3f}s".format(len(self.osd_id_list),
                                               (osd_stats_end - osd_stats_start)))
 
+    def _rollup_histograms(self, osd_ids):
+        """
+        combine the interval's histograms of the osds that responded, to
+        give the latency percentiles for the host as a whole
+        :param osd_ids: (list) osd ids with current stats
+        """
+
+        host_histograms = {}
+        for osd_id in osd_ids:
+            for counter, histogram in self.osd[osd_id]._histograms.items():
+                if not histogram.valid:
+                    continue
+
+                if counter not in host_histograms:
+                    combined = self.host_histograms.get(counter)
+                    if (combined is None or
+                            combined[0] != histogram.edges):
+                        combined = [histogram.edges,
+                                    array('d', [0]) * histogram.size]
+                    else:
+                        counts = combined[1]
+                        for ptr in range(len(counts)):
+                            counts[ptr] = 0
+                    host_histograms[counter] = combined
+
+                edges, counts = host_histograms[counter]
+                if edges != histogram.edges:
+                    # osds with a different bucket layout can't be combined
+                    continue
+
+                delta = histogram.delta
+                for ptr in range(len(counts)):
+                    counts[ptr] += delta[ptr]
+
+        self.host_histograms = host_histograms
+
+    def _dump_host(self):
+
+        host = {}
+        for counter, (edges, counts) in self.host_histograms.items():
+            pct_values = LatencyHistogram.get_percentiles(counts, edges)
+            for pct in pct_values:
+                host[OSDstats.histogram_name(counter, pct)] = pct_values[pct]
+
+        return host
+
     @staticmethod
     def _dump_devs(device_dict):
 
@@ -318,7 +946,7 @@ class OSDs(BaseCollector):
 
         for dev_name in sorted(device_dict):
             device = device_dict[dev_name]
-            dumped[dev_name] = todict(device)
+            dumped[dev_name] = device.dump()
 
         return dumped
 
@@ -334,6 +962,10 @@ class OSDs(BaseCollector):
         osds = OSDs._dump_devs(self.osd)
         osds['ceph_version'] = self.version
         osds['num_osds'] = self.osd_count
+        if self.host_histograms:
+            osds['host'] = self._dump_host()
+        if self.disk_sampler:
+            osds['disk_sampler_busy'] = self.disk_sampler_busy
 
         return {
             "osd": osds,
@@ -344,7 +976,9 @@ class OSDs(BaseCollector):
 
         start = time.time()
 
-        self._dev_to_osd()
+        if self._layout_changed():
+            self._rescan = True
+            self._rescan = not self._dev_to_osd()
         self._stats_lookup()
 
         end = time.time()
@@ -50,10 +50,13 @@ class RGW(BaseCollector):
                 self.logger.warning("multiple rgw sockets found - "
                                     "data sent from {}".format(rgw_sockets[0]))
 
-            response = self._admin_socket(socket_path=rgw_sockets[0])
+            # only the rgw counters are of interest, so ask for just that
+            # section of the perf dump
+            key_name = 'client.rgw.{}'.format(self.host_name)
+            response = self._admin_socket(socket_path=rgw_sockets[0],
+                                          logger=key_name)
 
             if response:
-                key_name = 'client.rgw.{}'.format(self.host_name)
                 return response.get(key_name)
             else:
                 # admin_socket call failed
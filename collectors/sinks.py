@@ -0,0 +1,337 @@
+#!/usr/bin/env python
+
+import os
+import re
+import sys
+import json
+import time
+import socket
+import struct
+import logging
+
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
+from collectors.common import KeyFlattener, monotonic
+
+
+class Rates(object):
+    """
+    Turns derive counters into per second rates, like collectd's StoreRates
+    does for write_graphite. The first sample of a key has no rate
+    """
+
+    def __init__(self):
+        self._last = {}         # role -> {key_name: (value, monotonic time)}
+
+    def rate(self, role, metrics):
+        """
+        :param role: (str) role the metrics belong to
+        :param metrics: (list) (key_name, value, metric_type) tuples
+        :return: (list) metrics with derive values as rates, keys without
+                 a rate yet are dropped
+        """
+
+        now = monotonic()
+        last = self._last.get(role, {})
+        current = {}
+        rated = []
+
+        for key_name, value, metric_type in metrics:
+            if metric_type != 'derive':
+                rated.append((key_name, value, metric_type))
+                continue
+
+            current[key_name] = (value, now)
+            previous = last.get(key_name)
+            if previous is None or now <= previous[1]:
+                continue
+
+            rated.append((key_name,
+                          (value - previous[0]) / (now - previous[1]),
+                          metric_type))
+
+        # keys no longer reported drop out with the previous cycle
+        self._last[role] = current
+        return rated
+
+
+class Sink(object):
+    """
+    Base of the destinations for the metrics of the standalone daemon. Each
+    sink provides write(role, metrics, timestamp), that's called with the
+    metrics of each role collected:
+      role       (str) role the metrics belong to e.g. osd
+      metrics    (list) (key_name, value, metric_type) tuples, where key_name
+                 is the flattened stats key e.g. osd.0.op_r
+      timestamp  (float) epoch time of the read cycle
+    and flush is called once all the roles of a read cycle have been written
+    """
+
+    def __init__(self, cluster_name, host_name):
+        self.cluster_name = cluster_name
+        self.host_name = host_name
+        self.logger = logging.getLogger('cephmetrics')
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class GraphiteSink(Sink):
+    """
+    Send metrics to carbon over the plaintext protocol, using the same names
+    as collectd's write_graphite (Prefix "collectd.", PreserveSeparator,
+    SeparateInstances and StoreRates) so the dashboards work unchanged
+    """
+
+    default_port = 2003
+
+    # write_graphite's EscapeCharacter
+    escape = re.compile(r'[^\w.:\-]')
+
+    def __init__(self, cluster_name, host_name, host, port=None,
+                 prefix='collectd.', timeout=5):
+        Sink.__init__(self, cluster_name, host_name)
+        self.address = (host, int(port or self.default_port))
+        self.prefix = '{}{}.cephmetrics.'.format(
+            prefix, GraphiteSink.escape.sub('_', host_name))
+        self.timeout = timeout
+        self.rates = Rates()
+        self._conn = None
+        self._pending = []      # (path, value, timestamp)
+
+    def path(self, key_name, metric_type):
+        return GraphiteSink.escape.sub('_', '{}{}.{}.{}'.format(
+            self.prefix, metric_type, self.cluster_name, key_name))
+
+    def write(self, role, metrics, timestamp):
+        timestamp = int(timestamp)
+        self._pending.extend(
+            (self.path(key_name, metric_type), value, timestamp)
+            for key_name, value, metric_type in self.rates.rate(role,
+                                                                metrics))
+
+    def encode(self, pending):
+        return ''.join('{} {} {}\n'.format(path, value, timestamp)
+                       for path, value, timestamp in pending)
+
+    def send(self, data):
+        if self._conn is None:
+            self._conn = socket.create_connection(self.address,
+                                                  timeout=self.timeout)
+        self._conn.sendall(data)
+
+    def flush(self):
+        pending, self._pending = self._pending, []
+        if not pending:
+            return
+
+        try:
+            self.send(self.encode(pending))
+        except (socket.error, socket.timeout) as e:
+            # the cycle's metrics are dropped, and the connection is retried
+            # on the next flush
+            self.logger.warning("{}:{} unavailable, {} metrics dropped - "
+                                "{}".format(self.address[0], self.address[1],
+                                            len(pending), e))
+            self.close()
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+
+class PickleSink(GraphiteSink):
+    """
+    Send metrics to carbon over the pickle protocol, in batches of up to
+    batch_size metrics per message
+    """
+
+    default_port = 2004
+
+    def __init__(self, cluster_name, host_name, host, port=None,
+                 prefix='collectd.', timeout=5, batch_size=500):
+        GraphiteSink.__init__(self, cluster_name, host_name, host, port,
+                              prefix, timeout)
+        self.batch_size = batch_size
+
+    def encode(self, pending):
+        messages = []
+        for start in range(0, len(pending), self.batch_size):
+            payload = pickle.dumps([(path, (timestamp, value))
+                                    for path, value, timestamp
+                                    in pending[start:start + self.batch_size]],
+                                   protocol=2)
+            messages.append(struct.pack('!L', len(payload)) + payload)
+
+        return b''.join(messages)
+
+
+class JSONSink(Sink):
+    """
+    Write each metric as a JSON object on it's own line, to stdout or a file
+    """
+
+    def __init__(self, cluster_name, host_name, path=None):
+        Sink.__init__(self, cluster_name, host_name)
+        if path in (None, '-'):
+            self.stream = sys.stdout
+        else:
+            self.stream = open(path, 'a')
+
+    def write(self, role, metrics, timestamp):
+        for key_name, value, metric_type in metrics:
+            self.stream.write(json.dumps({"time": timestamp,
+                                          "host": self.host_name,
+                                          "cluster": self.cluster_name,
+                                          "role": role,
+                                          "metric": key_name,
+                                          "type": metric_type,
+                                          "value": value}) + '\n')
+
+    def flush(self):
+        self.stream.flush()
+
+    def close(self):
+        if self.stream is not sys.stdout:
+            self.stream.close()
+
+
+class PrometheusSink(Sink):
+    """
+    Maintain a file for node_exporter's textfile collector. A metric is
+    named from the role and the last part of it's key, with the rest of the
+    key as a label e.g. osd.0.op_r -> cephmetrics_osd_op_r{key="0"}. The file
+    holds the latest metrics of every role, and is replaced atomically
+    """
+
+    invalid = re.compile(r'[^a-zA-Z0-9_]')
+
+    def __init__(self, cluster_name, host_name, path):
+        Sink.__init__(self, cluster_name, host_name)
+        self.path = path
+        self._samples = {}      # role -> {name: (metric_type, [samples])}
+        self._changed = False
+
+    @staticmethod
+    def label(value):
+        return str(value).replace('\\', r'\\').replace('"', r'\"')
+
+    def write(self, role, metrics, timestamp):
+        samples = {}
+        for key_name, value, metric_type in metrics:
+            parts = key_name.split('.')
+            name = PrometheusSink.invalid.sub(
+                '_', 'cephmetrics_{}_{}'.format(parts[0], parts[-1]))
+            if name not in samples:
+                samples[name] = (metric_type, [])
+            samples[name][1].append(
+                '{}{{cluster="{}",key="{}"}} {}'.format(
+                    name, self.label(self.cluster_name),
+                    self.label('.'.join(parts[1:-1])), value))
+
+        self._samples[role] = samples
+        self._changed = True
+
+    def flush(self):
+        if not self._changed:
+            return
+
+        lines = []
+        for role in sorted(self._samples):
+            samples = self._samples[role]
+            for name in sorted(samples):
+                metric_type, values = samples[name]
+                lines.append('# TYPE {} {}'.format(
+                    name, 'counter' if metric_type == 'derive' else 'gauge'))
+                lines.extend(values)
+
+        tmp_path = '{}.{}.tmp'.format(self.path, os.getpid())
+        with open(tmp_path, 'w') as tmp:
+            tmp.write('\n'.join(lines) + '\n')
+        os.rename(tmp_path, self.path)
+        self._changed = False
+
+
+# sink name -> (class, takes an address)
+sink_types = {
+    "graphite": (GraphiteSink, True),
+    "pickle": (PickleSink, True),
+    "json": (JSONSink, False),
+    "prometheus": (PrometheusSink, False)
+}
+
+
+def create_sink(spec, cluster_name, host_name):
+    """
+    Create a sink from it's command line spec
+      graphite:HOST[:PORT]  carbon plaintext (port 2003)
+      pickle:HOST[:PORT]    carbon pickle (port 2004)
+      json[:PATH]           JSON lines to stdout, or appended to PATH
+      prometheus:PATH       node_exporter textfile e.g. /path/ceph.prom
+    :param spec: (str) sink spec
+    :return: (Sink) sink instance
+    """
+
+    sink_name, _sep, target = spec.partition(':')
+    if sink_name not in sink_types:
+        raise ValueError("unknown sink '{}' - must be one of : "
+                         "{}".format(sink_name, ', '.join(sorted(sink_types))))
+
+    sink_class, networked = sink_types[sink_name]
+
+    if networked:
+        host, _sep, port = target.partition(':')
+        if not host or (port and not port.isdigit()):
+            raise ValueError("{} sink needs HOST[:PORT]".format(sink_name))
+        return sink_class(cluster_name, host_name, host, port or None)
+
+    if sink_class is PrometheusSink and not target:
+        raise ValueError("prometheus sink needs the textfile PATH")
+
+    return sink_class(cluster_name, host_name, target or None)
+
+
+class SinkWriter(object):
+    """
+    Flatten each role's stats once, and write them to all the sinks. The
+    metric type of a key is taken from the role's metrics in the same way as
+    the collectd DispatchTable
+    """
+
+    def __init__(self, sinks):
+        self.sinks = sinks
+        self.flattener = KeyFlattener('.')
+
+    def write(self, role, role_metrics, stats):
+        metrics = []
+        for key_name, value in self.flattener.items(stats):
+            attr_name = key_name.rsplit('.', 1)[-1]
+            if attr_name in role_metrics:
+                metric_type = role_metrics[attr_name][1]
+            else:
+                metric_type = 'gauge'
+            metrics.append((key_name, value, metric_type))
+
+        timestamp = time.time()
+        for sink in self.sinks:
+            sink.write(role, metrics, timestamp)
+
+    def flush(self):
+        for sink in self.sinks:
+            try:
+                sink.flush()
+            except (IOError, OSError) as e:
+                sink.logger.error("{} flush failed - "
+                                  "{}".format(sink.__class__.__name__, e))
+
+    def close(self):
+        self.flush()
+        for sink in self.sinks:
+            sink.close()
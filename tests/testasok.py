@@ -0,0 +1,128 @@
+#!/usr/bin/env python
+
+# Runs the AdminSocket client against a local fake admin socket, so the
+# client can be exercised and timed without a ceph daemon. When the
+# ceph_daemon module is installed, it's timed against the same server too.
+#
+#   python tests/testasok.py [calls]
+
+import os
+import sys
+import json
+import time
+import socket
+import struct
+import tempfile
+import threading
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from collectors.asok import AdminSocket
+
+
+def fake_perf_dump(sections=40, counters=60):
+    # roughly the shape and size of a bluestore OSD's perf dump
+    dump = {}
+    for section in range(sections):
+        dump['section_{}'.format(section)] = {
+            'counter_{}'.format(ctr): {'avgcount': ctr * 10, 'sum': ctr * 0.5}
+            for ctr in range(counters)}
+    return dump
+
+
+class FakeAdminSocket(threading.Thread):
+    """
+    Minimal admin socket server. Like a ceph daemon, the connection is
+    closed after each reply unless keepalive is set
+    """
+
+    commands = {
+        "get_command_descriptions": {
+            "cmd000": {"sig": ["perf", "dump"], "help": "", "module": "",
+                       "perm": "r", "avail": "cli"},
+            "cmd001": {"sig": ["version"], "help": "", "module": "",
+                       "perm": "r", "avail": "cli"}
+        },
+        "version": {"version": "12.2.5"}
+    }
+
+    def __init__(self, path, keepalive=False):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.path = path
+        self.keepalive = keepalive
+        self.replies = dict(FakeAdminSocket.commands)
+        self.replies['perf dump'] = fake_perf_dump()
+        self.server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.server.bind(path)
+        self.server.listen(5)
+
+    def _handle(self, conn):
+        request = b''
+        while True:
+            data = conn.recv(4096)
+            if not data:
+                return
+            request += data
+            while b'\0' in request:
+                cmd, request = request.split(b'\0', 1)
+                prefix = json.loads(cmd.decode('utf-8'))['prefix']
+                payload = json.dumps(self.replies.get(prefix, {}))
+                conn.sendall(struct.pack('>I', len(payload)) +
+                             payload.encode('utf-8'))
+                if not self.keepalive:
+                    return
+
+    def run(self):
+        while True:
+            conn, _addr = self.server.accept()
+            try:
+                self._handle(conn)
+            finally:
+                conn.close()
+
+
+def timed(desc, func, calls):
+    start = time.time()
+    for _n in range(calls):
+        func()
+    elapsed = time.time() - start
+    print("{:<32} {:>8.3f}ms per call".format(desc,
+                                             elapsed / calls * 1000))
+
+
+def main():
+    calls = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    tmp_dir = tempfile.mkdtemp()
+
+    for keepalive in (False, True):
+        path = os.path.join(tmp_dir, 'ceph-osd.{}.asok'.format(int(keepalive)))
+        server = FakeAdminSocket(path, keepalive=keepalive)
+        server.start()
+
+        client = AdminSocket(path)
+        resp = json.loads(client.command('perf dump'))
+        assert resp == server.replies['perf dump']
+        assert json.loads(client.command('version')) == {"version": "12.2.5"}
+
+        print("perf dump of {} bytes, keepalive={}".format(
+            len(json.dumps(resp)), keepalive))
+        timed("AdminSocket", lambda: client.command('perf dump'), calls)
+
+        try:
+            from ceph_daemon import admin_socket
+        except ImportError:
+            print("ceph_daemon not available, comparison skipped")
+        else:
+            timed("ceph_daemon.admin_socket",
+                  lambda: admin_socket(path, ['perf', 'dump'], 'json'),
+                  calls)
+
+        client.close()
+        os.unlink(path)
+
+    os.rmdir(tmp_dir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,215 @@
+#!/usr/bin/env python
+
+# Checks the DiskStats iostat engine against hand computed iostats, and when
+# numpy is installed, that the numpy and array code paths agree on random
+# counters - including devices that miss a sample, stop doing io, or have
+# an interval outside the engine's limits. The DiskStatsReader is checked
+# and timed against a diskstats file with thousands of dm entries, and the
+# DiskSampler's peaks are checked to be left out when there are no samples
+#
+#   python tests/testdiskstats.py [cycles]
+
+import os
+import sys
+import time
+import random
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from collectors.common import (DiskStats, DiskStatsReader, DiskSampler,
+                               IOstat, load_numpy)
+
+
+def raw_fields(reads=0, sectors_read=0, read_ms=0, writes=0,
+               sectors_written=0, write_ms=0, ms_active_io=0):
+    # a device's fields, in /proc/diskstats order
+    fields = [0] * DiskStats.fields
+    fields[DiskStats.reads] = reads
+    fields[DiskStats.sectors_read] = sectors_read
+    fields[DiskStats.read_ms] = read_ms
+    fields[DiskStats.writes] = writes
+    fields[DiskStats.sectors_written] = sectors_written
+    fields[DiskStats.write_ms] = write_ms
+    fields[DiskStats.ms_active_io] = ms_active_io
+    return [str(field) for field in fields]
+
+
+def test_iostats():
+    disk_stats = DiskStats(min_interval=0.5, max_interval=60)
+    iostat = IOstat()
+    disk_stats.add('sda', iostat)
+
+    disk_stats.begin()
+    disk_stats.set('sda', raw_fields(), 100.0)
+    disk_stats.compute()
+    assert iostat.dump() == {}, iostat.dump()
+
+    # over 2 secs - 100 reads of 8 sectors taking 200ms, 300 writes of 16
+    # sectors taking 900ms, and the device busy for 1 sec
+    disk_stats.begin()
+    disk_stats.set('sda', raw_fields(100, 800, 200, 300, 4800, 900, 1000),
+                   102.0)
+    disk_stats.compute()
+    expected = {"iops": 200.0, "r_iops": 50.0, "w_iops": 150.0,
+                "r_bytes_per_sec": 800 * 512 / 2.0,
+                "w_bytes_per_sec": 4800 * 512 / 2.0,
+                "bytes_per_sec": 5600 * 512 / 2.0,
+                "util": 50.0, "await": 1100 / 400.0,
+                "r_await": 2.0, "w_await": 3.0}
+    dumped = iostat.dump()
+    assert sorted(dumped) == sorted(expected), dumped
+    for name in expected:
+        assert abs(dumped[name] - expected[name]) < 1e-9, (name, dumped)
+
+    # too short an interval isn't reported
+    disk_stats.begin()
+    disk_stats.set('sda', raw_fields(200, 1600, 400, 300, 4800, 900, 1100),
+                   102.1)
+    disk_stats.compute()
+    assert iostat.dump() == {}, iostat.dump()
+    print("iostats ok")
+
+
+def test_parity(cycles):
+    numpy = load_numpy()
+    if numpy is None:
+        print("numpy not available, parity check skipped")
+        return
+
+    random.seed(1)
+    disk_stats = DiskStats(min_interval=0.5, max_interval=60)
+    for dev in range(8):
+        disk_stats.add('sd{}'.format(dev), IOstat())
+    disk_stats.remove('sd3')
+
+    raw = {dev_name: [random.randint(0, 1000)
+                      for _n in range(DiskStats.fields)]
+           for dev_name in disk_stats.slots}
+    timestamps = {dev_name: 0.0 for dev_name in disk_stats.slots}
+
+    for cycle in range(cycles):
+        disk_stats.begin()
+        for dev_name in sorted(disk_stats.slots):
+            if dev_name == 'sd5' and cycle % 3 == 1:
+                # missed sample
+                continue
+            timestamps[dev_name] += random.choice([0.2, 3.3, 5.0, 90.0])
+            idle = dev_name == 'sd1'
+            raw[dev_name] = [value + (0 if idle else random.randint(0, 50))
+                             for value in raw[dev_name]]
+            disk_stats.set(dev_name, [str(value) for value in raw[dev_name]],
+                           timestamps[dev_name])
+
+        for numpy_values, array_values in zip(disk_stats._compute_numpy(),
+                                              disk_stats._compute_array()):
+            assert (numpy_values is None) == (array_values is None), \
+                (cycle, numpy_values, array_values)
+            if numpy_values is None:
+                continue
+            for numpy_value, array_value in zip(numpy_values, array_values):
+                assert abs(numpy_value - array_value) < 1e-9, \
+                    (cycle, numpy_values, array_values)
+
+        disk_stats.compute()
+
+    print("numpy and array results agree over {} cycles".format(cycles))
+
+
+def write_diskstats(file_name, num_dm, disks, reverse=False):
+    # dm entries ahead of the disks, with each disk's reads set to it's
+    # minor number
+    with open(file_name, 'w') as diskstats:
+        for minor in range(num_dm):
+            diskstats.write('{:4d} {:7d} dm-{} {}\n'.format(
+                253, minor, minor, ' '.join(['1'] * 17)))
+        for minor in (reversed(range(disks)) if reverse else range(disks)):
+            diskstats.write('{:4d} {:7d} sd{} {} {}\n'.format(
+                8, minor, chr(97 + minor), minor, ' '.join(['2'] * 16)))
+
+
+def test_reader(calls):
+    file_name = tempfile.mktemp()
+    write_diskstats(file_name, 2000, 20)
+
+    disk_stats = DiskStats()
+    for minor in range(20):
+        disk_stats.add('sd{}'.format(chr(97 + minor)), IOstat())
+    disk_stats.add('dm-1', IOstat())
+
+    def reads(dev_name):
+        return disk_stats._current[disk_stats.slots[dev_name] *
+                                   DiskStats.fields + DiskStats.reads]
+
+    # a small buffer, so it has to grow to hold the file
+    reader = DiskStatsReader(disk_stats, file_name, buffer_size=4096)
+    assert reader.read() == 21
+    assert reads('sdc') == 2 and reads('dm-1') == 1
+    assert len(reader._buffer) >= os.path.getsize(file_name)
+
+    disk_stats.remove('dm-1')
+    assert reader.read() == 20
+
+    # the devices move within the file
+    write_diskstats(file_name, 2000, 20, reverse=True)
+    assert reader.read() == 20 and reads('sdc') == 2
+
+    # and some disappear
+    write_diskstats(file_name, 10, 5)
+    assert reader.read() == 5 and reads('sde') == 4
+
+    write_diskstats(file_name, 2000, 20)
+    start = time.time()
+    for _n in range(calls):
+        reader.read()
+    elapsed = time.time() - start
+    reader.close()
+    os.unlink(file_name)
+    print("reader ok, {:.3f}ms per read of 20 disks in {} "
+          "lines".format(elapsed / calls * 1000, 2020))
+
+
+def test_sampler():
+    file_name = tempfile.mktemp()
+    sampler = DiskSampler(rate=0.2)
+    sampler.reader = DiskStatsReader(sampler.disk_stats, file_name)
+    iostat = IOstat()
+    sampler.add('sda', iostat)
+
+    # a device without samples has no peak or 95th percentile to report
+    sampler.drain()
+    assert not [name for name in iostat.dump()
+                if name in IOstat.sampler_metrics], iostat.dump()
+
+    for reads in (0, 10, 30):
+        with open(file_name, 'w') as diskstats:
+            diskstats.write('   8       0 sda {} {}\n'.format(
+                reads, ' '.join(['0'] * 16)))
+        sampler._sample()
+        time.sleep(0.2)
+    sampler.drain()
+    dumped = iostat.dump()
+    assert sorted(name for name in dumped
+                  if name in IOstat.sampler_metrics) == \
+        sorted(IOstat.sampler_metrics), dumped
+    assert 75 < dumped['iops_max'] <= 100, dumped
+
+    # nor once the samples have been drained
+    sampler.drain()
+    assert not [name for name in iostat.dump()
+                if name in IOstat.sampler_metrics], iostat.dump()
+    sampler.reader.close()
+    os.unlink(file_name)
+    print("sampler ok")
+
+
+def main():
+    cycles = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    test_iostats()
+    test_parity(cycles)
+    test_reader(200)
+    test_sampler()
+
+
+if __name__ == "__main__":
+    main()
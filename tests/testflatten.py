@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+
+# Compares the flattening of the stats tree by flatten_dict and by a
+# KeyFlattener, on trees shaped like the osd and mon collector output
+#
+#   python tests/testflatten.py [cycles]
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from collectors.common import flatten_dict, KeyFlattener, IOstat
+
+
+def osd_tree(num_osds=24):
+    # dense osd host, with a data disk and a journal per osd
+    perf = {metric: 1.5 for metric in IOstat.metrics}
+    osds = {}
+    jrnl = {}
+    for osd_id in range(num_osds):
+        osds[str(osd_id)] = {"osd_type": 1, "osd_percent_used": 12.0,
+                             "stat_bytes": 4000, "stat_bytes_used": 480,
+                             "stat_bytes_avail": 3520, "submit_lat": 0.1,
+                             "throttle_lat": 0.1, "state_aio_wait_lat": 0.1,
+                             "kv_flush_lat": 0.1, "kv_commit_lat": 0.1}
+        disk = {"osd_id": str(osd_id), "rotational": 1, "disk_size": 4000,
+                "encrypted": 0, "osd_type": 1, "perf": dict(perf)}
+        osds['sd{}'.format(osd_id)] = disk
+        jrnl['nvme0n1p{}'.format(osd_id)] = dict(disk)
+    osds['ceph_version'] = 12
+    osds['num_osds'] = num_osds
+    return {"osd": osds, "jrnl": jrnl}
+
+
+def mon_tree(num_pools=64):
+    pool_stats = {"bytes_used": 100, "max_avail": 1000, "objects": 10,
+                  "dirty": 0, "rd_bytes": 10, "wr_bytes": 10, "rd": 1,
+                  "wr": 1, "num_rbds": 3, "rbd_scan_age": 20}
+    pools = {"pool{}".format(pool): dict(pool_stats)
+             for pool in range(num_pools)}
+    return {"mon": {"cluster": {"health": 0, "num_mon": 3,
+                                "num_mon_quorum": 3, "num_osd": 240,
+                                "num_osd_up": 240, "num_osd_in": 240,
+                                "num_osd_hosts": 10, "num_pg": 4096,
+                                "num_pg_active_clean": 4096,
+                                "num_rbds": 192},
+                    "pools": pools,
+                    "ceph_version": 12}}
+
+
+def timed(desc, func, cycles):
+    start = time.time()
+    for _n in range(cycles):
+        func()
+    elapsed = time.time() - start
+    print("{:<32} {:>8.3f}ms per cycle".format(desc,
+                                               elapsed / cycles * 1000))
+
+
+def main():
+    cycles = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+
+    for desc, tree in (("osd", osd_tree()), ("mon", mon_tree())):
+        flattener = KeyFlattener('.')
+        assert dict(flattener.items(tree)) == flatten_dict(tree, '.')
+
+        print("{} tree, {} keys".format(desc, len(flatten_dict(tree, '.'))))
+
+        # both consume the pairs, as the dispatch path does
+        def with_flatten_dict():
+            for _key, _value in flatten_dict(tree, '.').iteritems():
+                pass
+
+        def with_flattener():
+            for _key, _value in flattener.items(tree):
+                pass
+
+        timed("flatten_dict", with_flatten_dict, cycles)
+        timed("KeyFlattener", with_flattener, cycles)
+
+
+if __name__ == "__main__":
+    main()
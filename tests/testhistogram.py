@@ -0,0 +1,130 @@
+#!/usr/bin/env python
+
+# Checks the latency percentiles derived from perf histogram counters - per
+# osd across a daemon restart and a bucket layout change, and for the host
+# once the osd histograms are combined
+#
+#   python tests/testhistogram.py
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from collectors.osd import LatencyHistogram, OSDstats, OSDs
+
+COUNTER = 'op_r_latency_out_bytes_histogram'
+NAMES = [OSDstats.histogram_name(COUNTER, pct)
+         for pct in LatencyHistogram.percentiles]
+
+
+def axis(edges):
+    # latency axis of a perf histogram dump, with an overflow bucket
+    ranges = [{"max": -1}]
+    low = 0
+    for edge in edges:
+        ranges.append({"min": low, "max": edge})
+        low = edge + 1
+    ranges.append({"min": low})
+    return {"name": "Latency (usec)", "ranges": ranges}
+
+
+def histogram(edges, counts):
+    # a perf histogram dump entry, with a second axis of 2 buckets
+    return {"axes": [axis(edges), {"name": "Request size (bytes)"}],
+            "values": [[count, 0] for count in counts]}
+
+
+def sample(osd, data):
+    osd._update_histogram(COUNTER, data)
+    return {name: osd.counters[name] for name in NAMES
+            if name in osd.counters}
+
+
+def test_percentiles():
+    edges = [99, 999, 9999]
+
+    # 100 ops - 50 < 99us, 40 < 999us, 9 < 9999us, 1 in the overflow
+    counts = [0, 50, 40, 9, 1]
+    result = LatencyHistogram.get_percentiles(
+        counts, LatencyHistogram.axis_edges(axis(edges)))
+    assert result == {50: 99, 95: 9999, 99: 9999}, result
+
+    counts = [0, 50, 46, 3, 1]
+    result = LatencyHistogram.get_percentiles(
+        counts, LatencyHistogram.axis_edges(axis(edges)))
+    assert result == {50: 99, 95: 999, 99: 9999}, result
+
+    result = LatencyHistogram.get_percentiles([0, 0, 0, 0, 100],
+                                              [0, 99, 999, 9999, 10000])
+    assert result == {50: 10000, 95: 10000, 99: 10000}, result
+
+    # no ops in the interval, so there's no latency to report
+    assert LatencyHistogram.get_percentiles([0] * 5, [0] * 5) == {}
+    print("get_percentiles ok")
+
+
+def test_osd_histogram():
+    edges = [99, 999, 9999]
+    osd = OSDstats('bluestore')
+
+    # the first sample has no interval to report
+    assert sample(osd, histogram(edges, [0, 50, 40, 9, 1])) == {}
+
+    result = sample(osd, histogram(edges, [0, 150, 96, 12, 2]))
+    assert result == dict(zip(NAMES, [99, 999, 9999])), result
+
+    # counts going backwards means the osd restarted
+    assert sample(osd, histogram(edges, [0, 5, 0, 0, 0])) == {}
+    result = sample(osd, histogram(edges, [0, 5, 100, 0, 0]))
+    assert result == dict(zip(NAMES, [999, 999, 999])), result
+
+    # a new bucket layout starts over
+    assert sample(osd, histogram([9, 99, 999], [0, 5, 100, 0, 0])) == {}
+
+    # as does the counter disappearing from the dump
+    assert sample(osd, None) == {}
+    assert not osd._histograms[COUNTER].valid
+    print("osd histogram ok")
+
+
+def test_rollup():
+    edges = [99, 999, 9999]
+    osds = OSDs(None, 'ceph')
+    for osd_id, counts in (('0', [0, 90, 10, 0, 0]),
+                           ('1', [0, 0, 0, 10, 0]),
+                           ('2', [0, 0, 100, 0, 0])):
+        osd = OSDstats('bluestore')
+        sample(osd, histogram(edges, [0] * 5))
+        if osd_id == '2':
+            # a sample that doesn't match the layout leaves nothing to combine
+            sample(osd, histogram(edges, [0] * 5))
+            sample(osd, histogram(edges, [0, 0, 0, 0, 0, 0]))
+        else:
+            sample(osd, histogram(edges, counts))
+        osds.osd[osd_id] = osd
+
+    osds._rollup_histograms(['0', '1', '2'])
+    counts = list(osds.host_histograms[COUNTER][1])
+    assert counts == [0, 90, 10, 10, 0], counts
+
+    # 110 ops - 90 < 99us, 10 < 999us, 10 < 9999us
+    result = osds._dump_host()
+    assert result == dict(zip(NAMES, [99, 9999, 9999])), result
+
+    # an interval where no osd has a valid sample reports nothing
+    for osd_id in osds.osd:
+        osds.osd[osd_id]._histograms[COUNTER].invalidate()
+    osds._rollup_histograms(['0', '1', '2'])
+    assert osds._dump_host() == {}
+    print("host rollup ok")
+
+
+def main():
+    test_percentiles()
+    test_osd_histogram()
+    test_rollup()
+
+
+if __name__ == "__main__":
+    main()
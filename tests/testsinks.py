@@ -0,0 +1,244 @@
+#!/usr/bin/env python
+
+# Checks the output of the standalone daemon's sinks - the graphite and
+# pickle sinks are sent to a local carbon listener, the prometheus and json
+# sinks write to temporary files
+#
+#   python tests/testsinks.py
+
+import os
+import sys
+import json
+import time
+import socket
+import struct
+import tempfile
+import threading
+
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from collectors.sinks import (create_sink, SinkWriter, GraphiteSink,
+                              PickleSink, PrometheusSink)
+
+ROLE_METRICS = {"op_r": ("op_r", "derive"),
+                "stat_bytes": ("stat_bytes", "gauge")}
+
+
+def osd_stats(op_r):
+    return {"osd": {"0": {"op_r": op_r, "stat_bytes": 4000},
+                    "num_osds": 1}}
+
+
+class FakeCarbon(threading.Thread):
+    """ accepts a single connection, and keeps everything sent on it """
+
+    def __init__(self):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.server.bind(('127.0.0.1', 0))
+        self.server.listen(1)
+        self.port = self.server.getsockname()[1]
+        self.received = b''
+
+    def run(self):
+        conn, _addr = self.server.accept()
+        while True:
+            data = conn.recv(65536)
+            if not data:
+                break
+            self.received += data
+        conn.close()
+        self.server.close()
+
+
+def send_cycles(sink):
+    # two read cycles a second apart, so the derive counter has a rate
+    writer = SinkWriter([sink])
+    writer.write('osd', ROLE_METRICS, osd_stats(100))
+    writer.flush()
+    time.sleep(1)
+    writer.write('osd', ROLE_METRICS, osd_stats(150))
+    writer.close()
+
+
+def test_graphite():
+    carbon = FakeCarbon()
+    carbon.start()
+    sink = create_sink('graphite:127.0.0.1:{}'.format(carbon.port), 'ceph',
+                       'osd1.example.com')
+    assert isinstance(sink, GraphiteSink)
+    send_cycles(sink)
+    carbon.join()
+
+    prefix = 'collectd.osd1.example.com.cephmetrics.'
+    lines = [line.split() for line in
+             carbon.received.decode('utf-8').splitlines()]
+    paths = sorted(path for path, _value, _timestamp in lines)
+    assert paths == [prefix + 'derive.ceph.osd.0.op_r',
+                     prefix + 'gauge.ceph.osd.0.stat_bytes',
+                     prefix + 'gauge.ceph.osd.0.stat_bytes',
+                     prefix + 'gauge.ceph.osd.num_osds',
+                     prefix + 'gauge.ceph.osd.num_osds'], paths
+
+    # the counter is only sent from the second cycle, as a rate
+    rates = [float(value) for path, value, _timestamp in lines
+             if path == prefix + 'derive.ceph.osd.0.op_r']
+    assert len(rates) == 1 and 40 < rates[0] <= 50, rates
+    assert all(abs(int(timestamp) - time.time()) < 10
+               for _path, _value, timestamp in lines)
+    print("graphite ok")
+
+
+def test_pickle():
+    carbon = FakeCarbon()
+    carbon.start()
+    sink = create_sink('pickle:127.0.0.1:{}'.format(carbon.port), 'ceph',
+                       'osd1')
+    assert isinstance(sink, PickleSink)
+    sink.batch_size = 2
+    send_cycles(sink)
+    carbon.join()
+
+    batches = []
+    data = carbon.received
+    while data:
+        length = struct.unpack('!L', data[:4])[0]
+        batches.append(pickle.loads(data[4:4 + length]))
+        data = data[4 + length:]
+
+    # 2 metrics in the first cycle, 3 in the second
+    assert [len(batch) for batch in batches] == [2, 2, 1], batches
+    points = dict((path, point) for batch in batches for path, point in batch)
+    timestamp, value = points[
+        'collectd.osd1.cephmetrics.gauge.ceph.osd.0.stat_bytes']
+    assert value == 4000 and isinstance(timestamp, int)
+    print("pickle ok")
+
+
+def test_prometheus():
+    path = tempfile.mktemp(suffix='.prom')
+    sink = create_sink('prometheus:{}'.format(path), 'ceph', 'osd1')
+    assert isinstance(sink, PrometheusSink)
+    writer = SinkWriter([sink])
+    writer.write('osd', ROLE_METRICS, osd_stats(100))
+    writer.write('mon', {}, {"mon": {"pools": {"rbd": {"num_rbds": 3}}}})
+    writer.flush()
+
+    with open(path) as textfile:
+        lines = textfile.read().splitlines()
+    assert lines == [
+        '# TYPE cephmetrics_mon_num_rbds gauge',
+        'cephmetrics_mon_num_rbds{cluster="ceph",key="pools.rbd"} 3',
+        '# TYPE cephmetrics_osd_num_osds gauge',
+        'cephmetrics_osd_num_osds{cluster="ceph",key=""} 1',
+        '# TYPE cephmetrics_osd_op_r counter',
+        'cephmetrics_osd_op_r{cluster="ceph",key="0"} 100',
+        '# TYPE cephmetrics_osd_stat_bytes gauge',
+        'cephmetrics_osd_stat_bytes{cluster="ceph",key="0"} 4000'], lines
+
+    # a role's metrics are replaced as a whole, the other roles are kept
+    writer.write('osd', ROLE_METRICS, {"osd": {"num_osds": 0}})
+    writer.close()
+    with open(path) as textfile:
+        lines = textfile.read().splitlines()
+    assert lines[-1] == 'cephmetrics_osd_num_osds{cluster="ceph",key=""} 0'
+    assert len(lines) == 4, lines
+    assert not [name for name in os.listdir(os.path.dirname(path))
+                if name.startswith(os.path.basename(path) + '.')]
+    os.unlink(path)
+    print("prometheus ok")
+
+
+def test_json():
+    path = tempfile.mktemp()
+    writer = SinkWriter([create_sink('json:{}'.format(path), 'ceph', 'osd1')])
+    writer.write('osd', ROLE_METRICS, osd_stats(100))
+    writer.close()
+
+    with open(path) as lines:
+        records = sorted([json.loads(line) for line in lines],
+                         key=lambda record: record['metric'])
+    assert [(record['metric'], record['type'], record['value'])
+            for record in records] == [('osd.0.op_r', 'derive', 100),
+                                       ('osd.0.stat_bytes', 'gauge', 4000),
+                                       ('osd.num_osds', 'gauge', 1)]
+    assert records[0]['host'] == 'osd1' and records[0]['role'] == 'osd'
+    os.unlink(path)
+    print("json ok")
+
+
+def test_specs():
+    for spec in ('carbon:host', 'graphite', 'graphite:host:port',
+                 'prometheus'):
+        try:
+            create_sink(spec, 'ceph', 'osd1')
+        except ValueError:
+            pass
+        else:
+            raise AssertionError("{} accepted".format(spec))
+    print("sink specs ok")
+
+
+def test_options():
+    import cephmetrics
+
+    _args, conf = cephmetrics.parse_args(['-o', 'OSDInterval=5',
+                                          '-o', 'RBDScanTTL=60'])
+    assert [(node.key, node.values) for node in conf.children] == [
+        ('ClusterName', ['ceph']), ('OSDInterval', ['5']),
+        ('RBDScanTTL', ['60'])], conf.children
+
+    # bad numbers are a usage error, not a traceback from configure
+    stderr, sys.stderr = sys.stderr, open(os.devnull, 'w')
+    try:
+        for option in ('OSDInterval=x', 'MonTimeout=', 'ClusterName'):
+            try:
+                cephmetrics.parse_args(['-o', option])
+            except SystemExit as e:
+                assert e.code == 2, e.code
+            else:
+                raise AssertionError("{} accepted".format(option))
+    finally:
+        sys.stderr.close()
+        sys.stderr = stderr
+
+    # the same settings in a collectd <Module> block are logged, along with
+    # a bad LogLevel
+    cephmetrics.LOG_FILE = tempfile.mktemp()
+    conf = cephmetrics.ConfigNode('Module', ['cephmetrics'])
+    conf.children = [cephmetrics.ConfigNode(key, [value]) for key, value in
+                     (('LogLevel', 'trace'), ('OSDSampleRate', 'x'),
+                      ('RBDScanTTL', '60'), ('MonTimeout', '5s'),
+                      ('CollectorTimeout', '3'))]
+    assert not cephmetrics.configure(conf)
+    with open(cephmetrics.LOG_FILE) as log:
+        errors = [line.split(' - ', 3)[-1].strip() for line in log
+                  if ' ERROR ' in line]
+    assert errors == [
+        'cephmetrics: LogLevel specified is invalid - must be :debug or info',
+        'cephmetrics: OSDSampleRate specified is invalid - must be a number',
+        'cephmetrics: MonTimeout specified is invalid - must be a number',
+        'cephmetrics: ClusterName is required'], errors
+    assert cephmetrics.CEPH.rbd_scan_ttl == 60
+    assert cephmetrics.CEPH.timeout['mon'] == 3
+    os.unlink(cephmetrics.LOG_FILE)
+    print("options ok")
+
+
+def main():
+    test_graphite()
+    test_pickle()
+    test_prometheus()
+    test_json()
+    test_specs()
+    test_options()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+
+# Measures the startup time and peak RSS of loading the collectors for each
+# combination of roles, as Ceph.probe does (only the detected roles' modules
+# are imported), against the old behaviour of importing every collector.
+# Each measurement runs in a fresh interpreter.
+#
+#   python tests/teststartup.py [runs]
+
+import os
+import sys
+import json
+import itertools
+import subprocess
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+ROLE_MODULES = {
+    "mon": "collectors.mon",
+    "rgw": "collectors.rgw",
+    "osd": "collectors.osd",
+    "iscsi": "collectors.iscsi"
+}
+
+ROLES = ("mon", "rgw", "osd", "iscsi")
+
+# run in the child interpreter - imports the modules for the given roles, and
+# creates the osd role's DiskStats engine which loads numpy when present
+CHILD = """
+import sys
+import json
+import time
+import resource
+import importlib
+
+start = time.time()
+failed = []
+import collectors.base
+for role, module_name in json.loads(sys.argv[1]):
+    try:
+        importlib.import_module(module_name)
+    except ImportError as e:
+        failed.append("{}: {}".format(role, e))
+    else:
+        if role == 'osd':
+            from collectors.common import DiskStats
+            DiskStats()
+elapsed = time.time() - start
+rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(json.dumps({"elapsed": elapsed, "rss": rss, "failed": failed,
+                  "modules": len(sys.modules)}))
+"""
+
+
+def measure(roles, runs):
+    modules = [(role, ROLE_MODULES[role]) for role in roles]
+    results = []
+    for _n in range(runs):
+        out = subprocess.check_output([sys.executable, '-c', CHILD,
+                                       json.dumps(modules)], cwd=ROOT)
+        results.append(json.loads(out.decode('utf-8')))
+
+    # best of n for time, rss is stable across runs
+    best = min(results, key=lambda result: result['elapsed'])
+    return best
+
+
+def report(desc, result):
+    print("{:<24} {:>8.1f}ms {:>8.1f}MB {:>6} {}".format(
+        desc, result['elapsed'] * 1000, result['rss'] / 1024.0,
+        result['modules'], ', '.join(result['failed'])))
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+
+    print("{:<24} {:>10} {:>10} {:>6}".format("roles", "startup",
+                                              "max rss", "mods"))
+
+    report("all (eager import)", measure(ROLES, runs))
+
+    for count in range(len(ROLES) + 1):
+        for roles in itertools.combinations(ROLES, count):
+            report('+'.join(roles) or 'none', measure(roles, runs))
+
+
+if __name__ == "__main__":
+    main()